@@ -4,6 +4,7 @@ import http.client
 import json
 import logging
 import os
+import time
 import urllib.parse
 import urllib.request
 
@@ -17,6 +18,10 @@ logger.setLevel(log_level)
 AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
 ACTION_GROUP_NAME = os.environ.get("ACTION_GROUP", "action-group-web-search-d213q")
 FUNCTION_NAMES = ["tavily-ai-search", "google-search"]
+SECRET_REFRESH_SECONDS = int(os.environ.get("SECRET_REFRESH_SECONDS", "3600"))
+
+# Secrets fetched so far by this Lambda container, kept as {key: (value, fetched_at)}
+_secret_cache: dict = {}
 
 
 def is_env_var_set(env_var: str) -> bool:
@@ -41,8 +46,13 @@ def get_from_secretstore_or_env(key: str) -> str:
     return secret
 
 
-SERPER_API_KEY = get_from_secretstore_or_env("SERPER_API_KEY")
-TAVILY_API_KEY = get_from_secretstore_or_env("TAVILY_API_KEY")
+def get_api_key(key: str) -> str:
+    """Fetch a secret on first use and reuse it for SECRET_REFRESH_SECONDS across warm invocations."""
+    value, fetched_at = _secret_cache.get(key, (None, 0.0))
+    if value is None or time.time() - fetched_at > SECRET_REFRESH_SECONDS:
+        value = get_from_secretstore_or_env(key)
+        _secret_cache[key] = (value, time.time())
+    return value
 
 
 def extract_search_params(action_group, function, parameters):
@@ -74,7 +84,7 @@ def tavily_ai_search(search_query: str, target_website: str = "") -> str:
     base_url = "https://api.tavily.com/search"
     headers = {"Content-Type": "application/json", "Accept": "application/json"}
     payload = {
-        "api_key": TAVILY_API_KEY,
+        "api_key": get_api_key("TAVILY_API_KEY"),
         "query": search_query,
         "search_depth": "advanced",
         "include_images": False,
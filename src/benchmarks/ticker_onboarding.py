@@ -0,0 +1,250 @@
+"""
+End-to-end benchmark of ticker onboarding, from a ticker being typed to the first chat token.
+Run from src, against the local stand-ins or the live backends:
+
+    python -m benchmarks.ticker_onboarding AAPL MSFT --backend fake --iterations 20
+    python -m benchmarks.ticker_onboarding AAPL --backend live --iterations 3 --compare previous.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import subprocess
+import importlib.util
+
+PAGE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pages", "Stock_Analysis.py")
+STAGES = [
+    'info',
+    'search_fanout',
+    'context_build',
+    'overview_first_token',
+    'overview_completion',
+    'chat_first_token',
+    'chat_completion',
+]
+DEFAULT_PROMPT = "What are the main risks facing this company over the next year?"
+
+def percentile(values, q):
+    """
+    q-th percentile of values with linear interpolation between the closest ranks.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * q / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+def summarize(values):
+    if not values:
+        return {'n': 0}
+    return {
+        'n': len(values),
+        'mean': sum(values) / len(values),
+        'min': min(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': max(values),
+    }
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def load_page():
+    # The page runs its dashboard only under __main__, so importing it just defines the onboarding functions
+    spec = importlib.util.spec_from_file_location("stock_analysis_page", PAGE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class progressRecorder():
+    def __init__(self):
+        """
+        Stands in for the progress queue of the executor jobs and timestamps each build step.
+        """
+        self.events = []
+
+    def put(self, event):
+        self.events.append((time.perf_counter(), event))
+
+def time_stream(chunks, started_at):
+    """
+    Consumes a stream of text chunks, returns the seconds to the first chunk, to the last one and the text.
+    """
+    first_token = None
+    parts = []
+    for chunk in chunks:
+        if first_token is None:
+            first_token = time.perf_counter() - started_at
+        parts.append(chunk)
+    return first_token, time.perf_counter() - started_at, "".join(parts)
+
+class tickerOnboardingBenchmark():
+    def __init__(self, tickers: list, iterations=5, prompt=DEFAULT_PROMPT, cold=True):
+        """
+        Drives set_ticker_system_instructs, the ticker overview and one chat turn of the Stock Analysis page
+        for each ticker, and records the latency of every stage.
+
+        Parameters
+        ----------
+        tickers : list
+            Ticker symbols onboarded in each iteration.
+        iterations : int
+            Number of times each ticker is onboarded.
+        prompt : str
+            Question asked in the chat turn.
+        cold : bool
+            Whether the search and market data caches are cleared before each onboarding.
+        """
+        self.tickers = [ticker.upper() for ticker in tickers]
+        self.iterations = iterations
+        self.prompt = prompt
+        self.cold = cold
+        self.page = load_page()
+        self.samples = {stage: [] for stage in STAGES}
+        self.runs = []
+
+    def clear_caches(self, ticker):
+        from scripts.web_search.searchCache import get_search_cache
+        from scripts.web_search.sharedResults import get_shared_results
+        from scripts.market_data import get_ticker_data_cache
+        get_search_cache().clear()
+        get_shared_results().clear()
+        get_ticker_data_cache().invalidate(ticker)
+
+    def onboard(self, ticker):
+        """
+        Onboards one ticker the way the dashboard does, returns the duration of each stage in seconds.
+        """
+        if self.cold:
+            self.clear_caches(ticker)
+        timings = {}
+        recorder = progressRecorder()
+        started_at = time.perf_counter()
+        system_instructs = self.page.set_ticker_system_instructs(ticker, force_refresh=True, progress=recorder)
+        built_at = time.perf_counter()
+
+        info_at = next((at for at, event in recorder.events if event['stage'] == 'info'), started_at)
+        search_times = [at for at, event in recorder.events if event['stage'] in ('search', 'board_members')]
+        searched_at = search_times[-1] if search_times else info_at
+        timings['info'] = info_at - started_at
+        timings['search_fanout'] = searched_at - info_at
+        timings['context_build'] = built_at - searched_at
+
+        agent_client = self.page.get_client('bedrock-agent-runtime')
+        session_id = str(uuid.uuid4())
+        overview_started_at = time.perf_counter()
+        timings['overview_first_token'], timings['overview_completion'], overview = time_stream(
+            self.page.invoke_agent_stream(agent_client, system_instructs, session_id), overview_started_at)
+        chat_started_at = time.perf_counter()
+        timings['chat_first_token'], timings['chat_completion'], answer = time_stream(
+            self.page.invoke_agent_stream(agent_client, self.prompt, session_id), chat_started_at)
+
+        payload_bytes = {
+            'system_instructs': len(system_instructs.encode('utf-8')),
+            'overview': len(overview.encode('utf-8')),
+            'chat_answer': len(answer.encode('utf-8')),
+        }
+        return timings, payload_bytes
+
+    def run(self):
+        from scripts.web_search.searchCache import get_search_cache
+        from utils.aws_clients import get_client_stats
+        from utils.fake_backends import BACKEND_STATS
+
+        BACKEND_STATS.reset()
+        start_time = time.time()
+        for iteration in range(self.iterations):
+            for ticker in self.tickers:
+                run = {'iteration': iteration, 'ticker': ticker}
+                try:
+                    timings, payload_bytes = self.onboard(ticker)
+                    run.update(timings=timings, bytes=payload_bytes)
+                    for stage, seconds in timings.items():
+                        if seconds is not None:
+                            self.samples[stage].append(seconds)
+                except Exception as e:
+                    run['error'] = str(e)
+                    print(f"Onboarding {ticker} failed: {str(e)}")
+                self.runs.append(run)
+
+        return {
+            'benchmark': 'ticker_onboarding',
+            'commit': get_git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'duration': time.time() - start_time,
+            'config': {
+                'tickers': self.tickers,
+                'iterations': self.iterations,
+                'cold': self.cold,
+                'backend': os.environ.get("DATATHON_BACKEND", "live"),
+                'fake_latency_ms': os.environ.get("FAKE_LATENCY_MS"),
+                'fake_error_rate': os.environ.get("FAKE_ERROR_RATE"),
+            },
+            'stages': {stage: summarize(values) for stage, values in self.samples.items()},
+            'failures': sum('error' in run for run in self.runs),
+            'calls': {
+                'backends': BACKEND_STATS.snapshot(),
+                'search_cache': get_search_cache().stats(),
+                'aws_clients': get_client_stats(),
+            },
+            'runs': self.runs,
+        }
+
+def print_report(results, baseline=None):
+    print(f"{'stage':<22}{'p50':>10}{'p95':>10}{'p99':>10}" + (f"{'p50 vs base':>14}" if baseline else ""))
+    for stage in STAGES:
+        summary = results['stages'][stage]
+        if not summary['n']:
+            continue
+        line = f"{stage:<22}" + "".join(f"{summary[q] * 1000:>8.0f}ms" for q in ('p50', 'p95', 'p99'))
+        base = (baseline or {}).get('stages', {}).get(stage, {})
+        if base.get('p50'):
+            line += f"{(summary['p50'] / base['p50'] - 1) * 100:>+13.1f}%"
+        print(line)
+    print(f"{results['failures']} failed onboardings, backend calls: {json.dumps(results['calls']['backends'])}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the latency of onboarding tickers on the Stock Analysis page.")
+    parser.add_argument("tickers", nargs="+", help="Ticker symbols to onboard")
+    parser.add_argument("--iterations", type=int, default=5, help="Number of times each ticker is onboarded")
+    parser.add_argument("--backend", choices=["fake", "live"], default="fake", help="Local stand-ins or the real services")
+    parser.add_argument("--latency-ms", type=float, help="Mean latency of the fake backends")
+    parser.add_argument("--error-rate", type=float, help="Share of fake backend calls that fail")
+    parser.add_argument("--warm", action="store_true", help="Keep the caches between onboardings")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="Question asked in the chat turn")
+    parser.add_argument("--output", help="JSON file the results are written to")
+    parser.add_argument("--compare", help="Earlier results file to compare the percentiles against")
+    args = parser.parse_args()
+
+    # Backends and caches are configured before the page and its clients are imported
+    os.environ["DATATHON_BACKEND"] = args.backend
+    if args.latency_ms is not None:
+        os.environ["FAKE_LATENCY_MS"] = str(args.latency_ms)
+    if args.error_rate is not None:
+        os.environ["FAKE_ERROR_RATE"] = str(args.error_rate)
+    if "DATATHON_CACHE_DIR" not in os.environ:
+        os.environ["DATATHON_CACHE_DIR"] = tempfile.mkdtemp(prefix="onboarding_benchmark_")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    benchmark = tickerOnboardingBenchmark(args.tickers, iterations=args.iterations, prompt=args.prompt, cold=not args.warm)
+    results = benchmark.run()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    output = args.output or f"ticker_onboarding_{results['commit'] or 'local'}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
@@ -1,27 +1,47 @@
 import streamlit as st
-import boto3
 import yfinance as yf
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import json
-from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_aws import BedrockEmbeddings, BedrockLLM
+from langchain_aws import BedrockLLM
 from langchain.prompts import PromptTemplate
-from langchain_community.vectorstores import Chroma
-import tempfile
-import os
+from utils.aws_clients import get_client, get_session
+from utils.tracing import span, traced
+from scripts.documents import CachedEmbeddings, ConcurrentEmbeddings, DocumentIndex, file_hash, pdf_chunk_batches, PdfStats, MapReduceSummarizer
+import time
+
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v1"
+MAX_EMBEDDING_WORKERS = 8
+# Summary modes offered in the dashboard
+SUMMARY_MODES = {
+    'retrieval': "Key passages (fastest)",
+    'map_reduce': "Full document (map-reduce)",
+}
+SUMMARY_TEMPLATE = """You are a financial analyst. Please provide a comprehensive summary of the following financial document. 
+                Focus on key financial metrics, business performance, risks, and strategic initiatives.
+                
+                Document content: {context}
+                
+                Please structure the summary as follows:
+                1. Financial Highlights
+                2. Business Performance
+                3. Key Risks
+                4. Strategic Initiatives
+                5. Outlook
+                
+                Summary:"""
 
 class DocumentSummarizer:
-    def __init__(self, session):
-        self.session = session
+    def __init__(self, session=None):
+        self.session = session if session is not None else get_session()
         
-        # Create bedrock-runtime client from session
-        self.bedrock_client = self.session.client(
-            service_name='bedrock-runtime',
+        # Pooled bedrock-runtime client, shared with the rest of the app
+        self.bedrock_client = get_client(
+            'bedrock-runtime',
             region_name=self.session.region_name
         )
         # Initialize LLM and embeddings
@@ -31,9 +51,21 @@ class DocumentSummarizer:
             model_kwargs={"maxTokenCount": 4096}
         )
         
-        self.embeddings = BedrockEmbeddings(
-            client=self.bedrock_client,
-            model_id="amazon.titan-embed-text-v1"
+        # Embeddings retry throttles themselves, botocore retries are off so every throttle lowers the concurrency
+        self.embedding_client = get_client(
+            'bedrock-runtime',
+            region_name=self.session.region_name,
+            retries={'max_attempts': 1, 'mode': 'standard'}
+        )
+        # Chunks already embedded, e.g. from a previous upload of the same report, are served from the cache,
+        # the others are embedded concurrently
+        self.embeddings = CachedEmbeddings(
+            ConcurrentEmbeddings(
+                self.embedding_client,
+                EMBEDDING_MODEL_ID,
+                max_workers=MAX_EMBEDDING_WORKERS
+            ),
+            EMBEDDING_MODEL_ID
         )
         
         # Initialize text splitter
@@ -43,94 +75,106 @@ class DocumentSummarizer:
             length_function=len
         )
 
-        # Create a temporary directory for Chroma
-        self.persist_directory = tempfile.mkdtemp()
+        # Documents are indexed once and kept across reruns and restarts, keyed by their content
+        self.index = DocumentIndex(self.embeddings)
 
+        # Reads every chunk of the document instead of the top passages only
+        self.map_reduce = MapReduceSummarizer(self.llm, SUMMARY_TEMPLATE)
+
+    @traced('document.process_document', record_result_size=False)
     def process_document(self, file):
-        """Process uploaded document and create vector store"""
+        """Process uploaded document into the document index and return its hash"""
+        # getvalue copies the whole upload, it is read once and the bytes are passed along
+        data = file.getvalue()
+        doc_hash = file_hash(data)
+        # Another session may be indexing the same file, it is then waited for instead of indexed twice
+        with self.index.ingest_lock(doc_hash):
+            if self.index.get(doc_hash) is not None:
+                print(f"Document {file.name} already indexed")
+                return doc_hash
+            self.ingest_document(data, file.name, doc_hash)
+        return doc_hash
+
+    def ingest_document(self, data, name, doc_hash):
+        """Parse, split and embed a document not yet in the index"""
         try:
-            # Save uploaded file temporarily
-            with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-                tmp_file.write(file.getvalue())
-                tmp_file_path = tmp_file.name
-
-            # Load and split document
-            loader = PyPDFLoader(tmp_file_path)
-            pages = loader.load()
-            splits = self.text_splitter.split_documents(pages)
-            
-            # Create vector store
-            vectorstore = Chroma.from_documents(
-                documents=splits,
-                embedding=self.embeddings,
-                persist_directory=self.persist_directory
-            )            
-            # Clean up temporary file
-            os.unlink(tmp_file_path)
+            # Pages are parsed and split from memory in the background while earlier chunks are embedded and indexed
+            with span('document.ingest', file_bytes=len(data)) as current:
+                stats = PdfStats()
+                misses = self.embeddings.misses
+                batches = pdf_chunk_batches(data, self.text_splitter, source=name, stats=stats)
+                vectorstore = self.index.add(doc_hash, name, batches)
+                current.set('pages', stats.pages)
+                current.set('chunks', stats.chunks)
+                current.set('chunks_embedded', self.embeddings.misses - misses)
             
             return vectorstore
 
         except Exception as e:
             raise Exception(f"Error processing document: {str(e)}")
 
-    def generate_summary(self, vectorstore):
-        """Generate financial document summary"""
+    @traced('document.generate_summary')
+    def generate_summary(self, doc_hash, mode='retrieval'):
+        """Generate financial document summary and the timings of its stages, summaries of known documents are served from the index"""
+        summary = self.index.get_summary(doc_hash, mode)
+        if summary is not None:
+            return summary, {'cached': True}
         try:
-
-            summary_prompt = PromptTemplate(
-                template="""You are a financial analyst. Please provide a comprehensive summary of the following financial document. 
-                Focus on key financial metrics, business performance, risks, and strategic initiatives.
-                
-                Document content: {context}
-                
-                Please structure the summary as follows:
-                1. Financial Highlights
-                2. Business Performance
-                3. Key Risks
-                4. Strategic Initiatives
-                5. Outlook
-                
-                Summary:""",
-                input_variables=["context"]
-            )
-
-            summary_chain = create_stuff_documents_chain(
-                llm=self.llm,
-                prompt=summary_prompt
-            )
-
-            relevant_docs = vectorstore.similarity_search(
-                "What are the main financial highlights and business performance?",
-                k=5
-            )
-            
-            summary = summary_chain.invoke({
-                "context": relevant_docs
-            })
+            if mode == 'map_reduce':
+                summary, timings = self.map_reduce.summarize(self.index.get_chunks(doc_hash))
+            else:
+                summary, timings = self.generate_retrieval_summary(doc_hash)
 
             formatted_summary = summary.replace(": ", "\n\n:")
+            self.index.put_summary(doc_hash, mode, formatted_summary)
 
-            return formatted_summary
+            return formatted_summary, timings
         except Exception as e:
             raise Exception(f"Error generating summary: {str(e)}")
 
-    def __del__(self):
-        """Cleanup temporary directory when object is destroyed"""
-        try:
-            import shutil
-            shutil.rmtree(self.persist_directory, ignore_errors=True)
-        except:
-            pass
+    def generate_retrieval_summary(self, doc_hash):
+        """Summarize the passages most relevant to the document's financial highlights"""
+        vectorstore = self.index.get(doc_hash)
+
+        summary_prompt = PromptTemplate(
+            template=SUMMARY_TEMPLATE,
+            input_variables=["context"]
+        )
+
+        summary_chain = create_stuff_documents_chain(
+            llm=self.llm,
+            prompt=summary_prompt
+        )
+
+        start_time = time.perf_counter()
+        relevant_docs = vectorstore.similarity_search(
+            "What are the main financial highlights and business performance?",
+            k=5
+        )
+        retrieved_at = time.perf_counter()
+        
+        summary = summary_chain.invoke({
+            "context": relevant_docs
+        })
+        finished_at = time.perf_counter()
+
+        return summary, {
+            'retrieval': retrieved_at - start_time,
+            'generation': finished_at - retrieved_at,
+            'total': finished_at - start_time,
+        }
+
+@st.cache_resource
+def get_summarizer():
+    # Built once per server instead of on every rerun, along with its Bedrock clients
+    return DocumentSummarizer(get_session())
 
 class DocumentAnalysisDashboard:
     def __init__(self):
         st.set_page_config(page_title="Document Summarizer", layout="wide")
         
-        # Initialize AWS session
-        self.aws_session = boto3.Session()
-        
         # Initialize document summarizer
-        self.summarizer = DocumentSummarizer(self.aws_session)
+        self.summarizer = get_summarizer()
         
         # Custom styling
         st.markdown("""
@@ -145,6 +189,15 @@ class DocumentAnalysisDashboard:
             </style>
         """, unsafe_allow_html=True)
 
+    @staticmethod
+    def describe_timings(timings):
+        if timings.get('cached'):
+            return "Served from the document index"
+        stages = [f"{stage} {seconds:.1f}s" for stage, seconds in timings.items() if isinstance(seconds, float)]
+        if timings.get('reduce_levels'):
+            stages.insert(1, f"reduce {sum(level['seconds'] for level in timings['reduce_levels']):.1f}s over {len(timings['reduce_levels'])} levels")
+        return "Stage timings: " + ", ".join(stages)
+
     def run(self):
         st.title("Financial Document Analyzer")
         
@@ -153,15 +206,22 @@ class DocumentAnalysisDashboard:
         st.markdown("Upload annual reports, financial statements, or other financial documents for AI-powered analysis.")
         
         uploaded_file = st.file_uploader("Drop your document here", type="pdf")
+        mode = st.radio(
+            "Summary mode",
+            options=list(SUMMARY_MODES),
+            format_func=SUMMARY_MODES.get,
+            horizontal=True,
+            help="Full document reads every page in parallel batches, it takes longer but covers the whole report."
+        )
         
         if uploaded_file:
             try:
                 with st.spinner("Processing document..."):
                     # Process document
-                    vectorstore = self.summarizer.process_document(uploaded_file)
+                    doc_hash = self.summarizer.process_document(uploaded_file)
                     
                     # Generate summary
-                    summary = self.summarizer.generate_summary(vectorstore)
+                    summary, timings = self.summarizer.generate_summary(doc_hash, mode)
                     summary = summary.replace('\n', ' ').replace('\r', '')
 
                     # Escape all $ signs to prevent rendering as LaTeX
@@ -173,6 +233,7 @@ class DocumentAnalysisDashboard:
                     # Display summary in a nice format
                     st.markdown("### Document Summary")
                     st.write(summary)
+                    st.caption(self.describe_timings(timings))
                     
                     # Add download button for summary
                     st.download_button(
@@ -11,10 +11,18 @@ import plotly.express as px
 import plotly.graph_objects as go
 import json
 import boto3
-from scripts import ChatBot
+from scripts import ChatBot, build_ticker_instructs, contextStore, responseCache, bedrock_embed
+from utils.aws_clients import get_client
+from utils.fake_backends import get_yf_ticker
+from utils.tracing import traced
+from utils.job_registry import JobRegistry, FOREGROUND_PRIORITY, REFRESH_PRIORITY
+from utils.prefetch_scheduler import PrefetchScheduler, MAX_RELATED
+from scripts.market_data import get_ticker_data_cache, get_price_history_store, MultiTickerInsights, get_related_tickers
 import time
 import concurrent.futures
 import uuid
+import codecs
+import hashlib
 
 AGENT_ALIAS_ID = "FFI0XWNCH7"
 AGENT_ID = "BWYEY0HCHS"
@@ -22,46 +30,120 @@ AGENT_ID = "BWYEY0HCHS"
 class TickerInsights:
     def __init__(self, ticker):
         self.ticker : str = ticker
-        self.ticker_obj : yf.Ticker = yf.Ticker(ticker)
+        self.ticker_obj : yf.Ticker = get_yf_ticker(ticker)
+        # Shared by every session and persisted for the executor workers, so each dataset is only downloaded once
+        self.data_cache = get_ticker_data_cache()
         print(f"TickerInsights object created for {ticker}")
     
     def get_summary(self):
-        return self.ticker_obj.info
+        return self.data_cache.get(self.ticker, 'info')
     
     def get_historical_data(self, period='1y'):
-        return self.ticker_obj.history(period=period)
+        # Served from the local Parquet store, only the bars missing since the last refresh are downloaded
+        return get_price_history_store().get_history(self.ticker, period)
     
     def get_recommendations(self):
-        return self.ticker_obj.recommendations
+        return self.data_cache.get(self.ticker, 'recommendations')
     
     def get_earnings(self):
-        return self.ticker_obj.income_stmt
+        return self.data_cache.get(self.ticker, 'income_stmt')
     
     def get_dividends(self):
-        return self.ticker_obj.dividends
+        return self.data_cache.get(self.ticker, 'dividends')
+
+@traced('bedrock.invoke_agent')
+def invoke_agent_stream(agent_client, input_text, session_id):
+    """
+    Invokes the agent and yields its answer chunk by chunk as the events arrive,
+    with dollar signs escaped for markdown.
+    """
+    response = agent_client.invoke_agent(
+        agentId=AGENT_ID,
+        agentAliasId=AGENT_ALIAS_ID,
+        inputText=input_text,
+        sessionId=session_id,
+    )
+    # A multi-byte character can be split across two chunks
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for event in response['completion']:
+        if 'chunk' in event:
+            text = decoder.decode(event['chunk']['bytes'])
+            if text:
+                yield text.replace("$", "\\$") # Escape dollar signs for markdown
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text.replace("$", "\\$")
 
 MAX_WORKERS = 2
 @st.cache_resource
 def get_executor():
     return concurrent.futures.ProcessPoolExecutor(max_workers=MAX_WORKERS)
 
-def set_ticker_system_instructs(ticker_input):
+@st.cache_resource
+def get_job_registry():
+    # Shared by every session so a ticker is only built once, however many users open it
+    return JobRegistry(get_executor(), max_in_flight=MAX_WORKERS)
+
+@st.cache_resource
+def get_response_cache():
+    # Shared by every session of the server, so analysts asking the same question get the same answer instantly
+    return responseCache(embed=bedrock_embed)
+
+def get_context_version(system_instructs):
+    return hashlib.sha1(system_instructs.encode('utf-8')).hexdigest()[:12]
+
+@st.cache_resource
+def get_context_store():
+    return contextStore()
+
+def set_ticker_system_instructs(ticker_input, force_refresh=False, progress=None):
+    """
+    Builds the system instructions of a ticker in an executor worker.
+    progress, if given, is a queue the build steps are reported on.
+    """
+    store = contextStore()
+    if not force_refresh:
+        # Another session or the batch builder may have built it in the meantime
+        stored = store.get_fresh(ticker_input)
+        if stored is not None:
+            return stored['system_instructs']
+
     insights = TickerInsights(ticker_input) # Have to redefine the object here to avoid pickling issues
     info = insights.get_summary()
-    obj = ChatBot(
-        company_ticker=ticker_input,
-        company_name=info.get('longName', 'N/A'),
-        industry_name=info.get('sector', 'N/A'),
-        sub_sector_name=info.get('industry', 'N/A'),
-        country=info.get('country', 'N/A'),
-        company_description=info.get('longBusinessSummary', 'N/A'),
-        board_members=info.get('companyOfficers', []),
-        variables=None,
-        search_selection=None, # Auto select all search features
-    )
-    obj.build_instructions()
+    if progress is not None:
+        progress.put({'stage': 'info'})
+    system_instructs = build_ticker_instructs(ticker_input, info, progress_callback=progress.put if progress is not None else None)
+    store.put(ticker_input, system_instructs, metadata={'source': 'dashboard'})
     print("Finished building system instructions")
-    return obj.system_instructs
+    return system_instructs
+
+def prefetch_ticker(ticker_input, progress=None):
+    """
+    Warms the market data and system instructions of a ticker the user is likely to open next.
+    """
+    insights = TickerInsights(ticker_input)
+    insights.get_historical_data()
+    insights.get_recommendations()
+    insights.get_earnings()
+    return set_ticker_system_instructs(ticker_input, progress=progress)
+
+@st.cache_resource
+def get_prefetch_scheduler():
+    return PrefetchScheduler(get_job_registry(), prefetch_ticker, max_related=MAX_RELATED)
+
+def describe_progress(event):
+    """
+    Turns a build progress event into a completion fraction and a message.
+    """
+    if event['stage'] == 'info':
+        return 0.05, "Fetched company information"
+    if event['stage'] == 'search':
+        return 0.05 + 0.85 * event['completed'] / event['total'], f"Searched the web for {event['key'].replace('_', ' ')} ({event['completed']}/{event['total']})"
+    if event['stage'] == 'board_members':
+        return 0.05 + 0.85 * event['completed'] / event['total'], f"Looked up board member {event['key']} ({event['completed']}/{event['total']})"
+    if event['stage'] == 'context':
+        return 1.0, f"Assembled the context ({event['tokens']} tokens)"
+    return 0.0, event['stage']
 
 class StockDashboard:
     def __init__(self):
@@ -81,18 +163,58 @@ class StockDashboard:
             st.session_state['ticker_ai_overview'] = {}
         if "messages" not in st.session_state:
             st.session_state.messages = []
-        if "futures" not in st.session_state:
-            st.session_state.futures = {}
-        if "instructs_loading" not in st.session_state:
-            st.session_state.instructs_loading = dict()
-
-        # Check if the ticker_input is new and not being processed, then start a new background thread
-        if (self.ticker_input not in st.session_state['ticker_system_instructs']) and (self.ticker_input not in st.session_state.instructs_loading):
-            print(f"Starting background thread for {self.ticker_input}")
-            st.session_state.instructs_loading[self.ticker_input] = True
-            future = get_executor().submit(set_ticker_system_instructs, self.ticker_input)
-            st.session_state.futures[self.ticker_input] = future
+        if "cached_exchanges" not in st.session_state:
+            # Exchanges answered from the response cache that the agent session has not seen yet
+            st.session_state.cached_exchanges = []
+        if "refresh_futures" not in st.session_state:
+            st.session_state.refresh_futures = {}
+
+        # Pick up contexts refreshed in the background since the last rerun
+        for ticker, future in list(st.session_state.refresh_futures.items()):
+            if future.done():
+                st.session_state.refresh_futures.pop(ticker)
+                if future.exception() is None:
+                    st.session_state['ticker_system_instructs'][ticker] = future.result()
+
+        # Serve contexts already built by a previous session or a batch run, refreshing stale ones in the background.
+        # Contexts in an older format are not served, they are rebuilt in the foreground below
+        if self.ticker_input not in st.session_state['ticker_system_instructs']:
+            stored = get_context_store().get(self.ticker_input)
+            if get_context_store().is_compatible(stored):
+                st.session_state['ticker_system_instructs'][self.ticker_input] = stored['system_instructs']
+                if not get_context_store().is_fresh(stored) and self.ticker_input not in st.session_state.refresh_futures:
+                    print(f"Refreshing stale context for {self.ticker_input}")
+                    st.session_state.refresh_futures[self.ticker_input] = get_job_registry().submit(
+                        ('refresh', self.ticker_input), set_ticker_system_instructs, self.ticker_input, True, priority=REFRESH_PRIORITY)
+
+        # Start building the context in the background, the registry joins any build already running for this ticker
+        if self.ticker_input not in st.session_state['ticker_system_instructs']:
+            print(f"Submitting background build for {self.ticker_input}")
+            # Foreground work goes first, prefetches that have not started are dropped
+            get_prefetch_scheduler().cancel_pending(keep=self.ticker_input)
+            get_job_registry().submit(self.ticker_input, set_ticker_system_instructs, self.ticker_input,
+                                      priority=FOREGROUND_PRIORITY, with_progress=True)
         
+    def prefetch_related_tickers(self):
+        """
+        Uses idle workers to warm the tickers the user is likely to open next: competitors and industry peers.
+        """
+        if self.ticker_input not in st.session_state['ticker_system_instructs']:
+            return
+        if "related_tickers" not in st.session_state:
+            # Related tickers still to warm, looked up once per ticker so reruns do not hit the context store again
+            st.session_state.related_tickers = {}
+        if self.ticker_input not in st.session_state.related_tickers:
+            related = get_related_tickers(self.ticker_input,
+                                          self.insights.get_summary(),
+                                          st.session_state['ticker_system_instructs'][self.ticker_input],
+                                          limit=MAX_RELATED)
+            st.session_state.related_tickers[self.ticker_input] = [ticker for ticker in related
+                                                                   if get_context_store().get_fresh(ticker) is None]
+        submitted = get_prefetch_scheduler().schedule(st.session_state.related_tickers[self.ticker_input])
+        if submitted:
+            print(f"Prefetching {submitted}")
+
     def display_summary(self):
         info = self.insights.get_summary()
         
@@ -192,19 +314,40 @@ class StockDashboard:
             fig = px.bar(df, title="Yearly Earnings")
             st.plotly_chart(fig, use_container_width=True)
             
+    def display_peer_comparison(self):
+        peers_input = st.text_input("Compare with (comma separated tickers)", "", key="peers_input")
+        peers = [peer.strip().upper() for peer in peers_input.split(",") if peer.strip()]
+        if not peers:
+            st.markdown("Enter one or more tickers to compare with")
+            return
+
+        peer_insights = MultiTickerInsights([self.ticker_input] + peers)
+        performance = peer_insights.get_relative_performance(period='1y')
+        if not performance.empty:
+            fig = px.line(performance, title="Relative Performance (rebased to 1)")
+            fig.update_layout(xaxis_title="Date", yaxis_title="Relative Close")
+            st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(peer_insights.get_summary_table(), use_container_width=True)
+
     def display_chat(self):
         if self.ticker_input not in st.session_state['ticker_system_instructs']:
             self.wait_for_system_instructs()
-            self.generate_ticker_overview() # To create initial overview for user + get a bunch of info into the chatbot context
-            st.rerun() # Rerun the script to display the chat
 
         if st.button("Start a New Chat"):
             with st.spinner("Resetting chat..."):
                 time.sleep(1)
             st.session_state.messages = []  # Clear the chat history
+            st.session_state.cached_exchanges = []
             # Store unique session ID for usage throughout the chat
             st.session_state['session_id'] = str(uuid.uuid4()) 
-            st.session_state['is_chat_reset'] = True
+        st.toggle("Reuse answers to common questions", key="use_response_cache",
+                  help="Answers to the first question of a chat are shared with other analysts looking at the same ticker")
+
+        # The overview also loads the ticker context into the agent session, so it is needed even mid-chat
+        if self.ticker_input not in st.session_state['ticker_ai_overview'] and st.session_state.messages:
+            with st.spinner("Generating overview..."):
+                for _ in self.generate_ticker_overview():
+                    pass
 
         chat_container = st.container()
 
@@ -215,12 +358,15 @@ class StockDashboard:
                     st.markdown(message["content"])
             if not st.session_state.messages:
                 with st.chat_message("assistant"):
-                    start_message = f"Hey there! I'm your personal financial analysis assistant. \n\nI've been specialized in financial analysis and have access to a lot of different types of data about this stock, including the information shown on this dashboard. \n\nAsk me any questions about this stock, its competitors, or the industry and we can start analyzing together! 🚀\n\n\n\n**To get started, here's an overview of the ticker you're interested in:**\n\n{st.session_state['ticker_ai_overview'][self.ticker_input]}"
-                    if 'is_chat_reset' in st.session_state and st.session_state['is_chat_reset']:
-                        st.write(start_message)
+                    start_message = "Hey there! I'm your personal financial analysis assistant. \n\nI've been specialized in financial analysis and have access to a lot of different types of data about this stock, including the information shown on this dashboard. \n\nAsk me any questions about this stock, its competitors, or the industry and we can start analyzing together! 🚀\n\n\n\n**To get started, here's an overview of the ticker you're interested in:**\n\n"
+                    st.markdown(start_message)
+                    if self.ticker_input in st.session_state['ticker_ai_overview']:
+                        overview = st.session_state['ticker_ai_overview'][self.ticker_input]
+                        st.markdown(overview)
                     else:
-                        st.write_stream(self.stream_data(start_message))
-                    st.session_state.messages.append({"role": "assistant", "content": start_message})
+                        # To create initial overview for user + get a bunch of info into the chatbot context
+                        overview = st.write_stream(self.generate_ticker_overview())
+                    st.session_state.messages.append({"role": "assistant", "content": start_message + overview})
 
         # Chat input
         if prompt := st.chat_input("What would you like to know about this stock?"):
@@ -230,97 +376,98 @@ class StockDashboard:
                 with st.chat_message("user"):
                     st.markdown(prompt)
 
-            # Get LLM response
+            # Stream the LLM response as it is generated
             with chat_container:
                 with st.chat_message("assistant"):
-
-                    with st.spinner("Thinking..."):
-                        response = self.get_llm_response(prompt)
-                    
+                    response = st.write_stream(self.get_llm_response(prompt))
                     assistant_message = {'role': 'assistant', 'content': response}
                     st.session_state.messages.append(assistant_message)
-                    st.write_stream(self.stream_data(response))
-    
-    def stream_data(self, data):
-        for word in data.split(" "):
-            yield word + " "
-            time.sleep(0.02)
 
     def wait_for_system_instructs(self):
-        future = st.session_state.futures.get(self.ticker_input)
-        if not future:
+        """
+        Shows the progress reported by the background build and returns as soon as it is done.
+        """
+        registry = get_job_registry()
+        job = registry.get(self.ticker_input)
+        if not job:
             return
 
-        stages = [
-            ("Searching the web for relevant information...", 15),
-            ("Building a profile for the target ticker...", 30),
-            ("Cleaning my room...", 45),
-            ("Formatting...", None)
-        ]
-
-        for message, max_time in stages:
-            with st.spinner(message):
-                start_time = time.time()
-                while not future.done():
-                    if max_time and (time.time() - start_time) > max_time:
-                        break
-                    time.sleep(0.1)
-                if future.done():
-                    st.session_state['ticker_system_instructs'][self.ticker_input] = future.result()
-                    _ = st.session_state.instructs_loading.pop(self.ticker_input)
-                    return
-                
+        with st.status("Building a profile for the target ticker...") as status:
+            progress_bar = st.progress(0.0, text="Waiting for a free worker...")
+            seen = 0
+            done = False
+            while not done:
+                # Blocks until the worker reports something new or finishes
+                events, done = registry.wait_for_progress(self.ticker_input, seen)
+                seen += len(events)
+                for event in events:
+                    progress_bar.progress(*describe_progress(event))
+            status.update(label="Profile ready", state="complete")
+
+        st.session_state['ticker_system_instructs'][self.ticker_input] = job.future.result()
+
     def generate_ticker_overview(self):
+        """
+        Sends the ticker context to a new agent session and yields the overview as it is generated.
+        """
         initial_prompt = st.session_state['ticker_system_instructs'][self.ticker_input]
-        agent_client = boto3.client('bedrock-agent-runtime')
+        agent_client = get_client('bedrock-agent-runtime')
 
         st.session_state['session_id'] = str(uuid.uuid4())
+        st.session_state.cached_exchanges = []
 
-        with st.spinner("Generating overview..."):
-            response = agent_client.invoke_agent(
-                agentId=AGENT_ID,
-                agentAliasId=AGENT_ALIAS_ID,
-                inputText=initial_prompt,
-                sessionId=st.session_state['session_id'],
-            )
-            # Format response for display
-            agent_answer = ''
-            for event in response['completion']:
-                if 'chunk' in list(event.keys()):
-                    agent_answer += event['chunk']['bytes'].decode('utf-8')
-
-            agent_answer = agent_answer.replace("$", "\\$") # Escape dollar signs for markdown
-            print(f"Overview generated: {agent_answer}")
-        
-            st.session_state["ticker_ai_overview"][self.ticker_input] = agent_answer
+        chunks = []
+        for chunk in invoke_agent_stream(agent_client, initial_prompt, st.session_state['session_id']):
+            chunks.append(chunk)
+            yield chunk
+        agent_answer = "".join(chunks)
+        print(f"Overview generated: {agent_answer}")
+
+        st.session_state["ticker_ai_overview"][self.ticker_input] = agent_answer
 
     def get_llm_response(self, prompt):
-        try:
-            # Prepare message payload for Claude
-            agent_client = boto3.client('bedrock-agent-runtime')
-
-            response = agent_client.invoke_agent(
-                agentId=AGENT_ID,
-                agentAliasId=AGENT_ALIAS_ID,
-                inputText=prompt,
-                sessionId=st.session_state['session_id'],
-            )
+        """
+        Yields the agent's answer to the prompt as it is generated.
+        When the response cache is enabled, the first question of a chat can be answered from the cache;
+        later questions bypass it since their answers depend on the chat history. Cached exchanges never reach
+        the agent session, so they are sent along with the next question the agent answers.
+        """
+        cache = get_response_cache() if st.session_state.get('use_response_cache') else None
+        if sum(message['role'] == 'user' for message in st.session_state.messages) > 1:
+            cache = None
+        context_version = get_context_version(st.session_state['ticker_system_instructs'][self.ticker_input])
+        if cache is not None:
+            cached_answer = cache.get(self.ticker_input, context_version, prompt)
+            if cached_answer is not None:
+                st.session_state.cached_exchanges.append((prompt, cached_answer.replace("\\$", "$")))
+                yield cached_answer
+                return
+
+        agent_prompt = prompt
+        if st.session_state.cached_exchanges:
+            earlier = "\n\n".join(f"Question: {question}\nYour answer: {answer}" for question, answer in st.session_state.cached_exchanges)
+            agent_prompt = f"Earlier in this conversation you were asked:\n\n{earlier}\n\nNow answer this question: {prompt}"
 
-            # Format response for display
-            agent_answer = ''
-            for event in response['completion']:
-                if 'chunk' in list(event.keys()):
-                    agent_answer += event['chunk']['bytes'].decode('utf-8')
-            agent_answer = agent_answer.replace("$", "\\$") # Escape dollar signs for markdown
-            return agent_answer
+        try:
+            agent_client = get_client('bedrock-agent-runtime')
+            chunks = []
+            for chunk in invoke_agent_stream(agent_client, agent_prompt, st.session_state['session_id']):
+                chunks.append(chunk)
+                yield chunk
+            st.session_state.cached_exchanges = []
+            if cache is not None:
+                cache.put(self.ticker_input, context_version, prompt, "".join(chunks))
 
         except Exception as e:
             print(f"Error getting response: {str(e)}")
-            return "I'm sorry, I encountered an issue while generating the answer. Please try again later."
+            yield "I'm sorry, I encountered an issue while generating the answer. Please try again later."
 
     def run(self):
         st.title(f"Financial Dashboard - {self.ticker_input}")
         
+        job_stats = get_job_registry().stats()
+        st.sidebar.caption(f"Background jobs: {job_stats['running']} running, {job_stats['queued']} queued")
+        
         self.display_summary()
 
         if st.toggle("AI Powered Interactive chat"):
@@ -336,7 +483,7 @@ class StockDashboard:
                 """)
             self.display_chat() 
         else:
-            tab1, tab2, tab3, tab4, tab5 = st.tabs(["Description","Price History", "Recommendations", "Earnings", "Board Members"])
+            tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Description","Price History", "Recommendations", "Earnings", "Board Members", "Peer Comparison"])
             with tab1:
                 self.display_company_info()
             with tab2:
@@ -347,6 +494,10 @@ class StockDashboard:
                 self.plot_earnings()
             with tab5:
                 self.display_board_members()
+            with tab6:
+                self.display_peer_comparison()
+
+        self.prefetch_related_tickers()
 
 if __name__ == "__main__":
     dashboard = StockDashboard()
@@ -1,2 +1,5 @@
 from .web_search import ChatBot
-from .web_search import initialLLMContext
\ No newline at end of file
+from .web_search import initialLLMContext
+from .web_search import build_ticker_instructs
+from .web_search import contextStore
+from .web_search import responseCache, bedrock_embed
@@ -0,0 +1,5 @@
+from .embeddingCache import EmbeddingCache, get_embedding_cache, CachedEmbeddings
+from .concurrentEmbeddings import ConcurrentEmbeddings
+from .documentIndex import DocumentIndex, file_hash
+from .pdfPipeline import pdf_chunk_batches, PdfStats
+from .mapReduceSummarizer import MapReduceSummarizer
@@ -0,0 +1,135 @@
+from utils.tracing import span
+from langchain_core.embeddings import Embeddings
+from botocore.exceptions import ConnectionError as BotocoreConnectionError, HTTPClientError
+import json
+import time
+import random
+import threading
+import concurrent.futures
+
+# Titan requests in flight at once per document
+MAX_EMBEDDING_WORKERS = 8
+# Attempts per chunk before the error is raised
+MAX_ATTEMPTS = 6
+# First backoff after a throttled request, doubled on each retry
+BASE_BACKOFF = 0.5
+THROTTLING_CODES = ('ThrottlingException', 'TooManyRequestsException', 'ServiceUnavailableException')
+
+def is_throttling(error):
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+    return code in THROTTLING_CODES or any(name in str(error) for name in THROTTLING_CODES)
+
+def is_transient(error):
+    """
+    Server errors and dropped or timed out connections, worth retrying but not a sign of overload.
+    """
+    if isinstance(error, (BotocoreConnectionError, HTTPClientError)):
+        return True
+    status = getattr(error, 'response', {}).get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+    return status >= 500
+
+class AdaptiveLimit():
+    def __init__(self, max_concurrent):
+        """
+        Concurrency limit that halves when requests are throttled and grows back by one
+        after a full window of successful requests.
+        """
+        self.max_concurrent = max_concurrent
+        self.limit = max_concurrent
+        self.in_flight = 0
+        self.successes = 0
+        self.throttles = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.max_concurrent:
+                self.limit += 1
+                self.successes = 0
+                self._condition.notify_all()
+
+    def on_throttle(self):
+        with self._condition:
+            self.throttles += 1
+            self.successes = 0
+            self.limit = max(self.limit // 2, 1)
+
+class ConcurrentEmbeddings(Embeddings):
+    def __init__(self, client, model_id, max_workers=MAX_EMBEDDING_WORKERS, max_attempts=MAX_ATTEMPTS):
+        """
+        Embeds the chunks of a document with concurrent Titan calls, at most max_workers in flight.
+        Throttled calls are retried with exponential backoff and lower the concurrency until requests succeed again,
+        the limit is kept across calls so the next batch of chunks starts where the previous one left off.
+        Server and connection errors are retried with the same backoff without lowering the concurrency.
+        Vectors are returned in the order of the chunks.
+
+        Parameters
+        ----------
+        client : botocore client
+            bedrock-runtime client, pooled with enough connections for max_workers and with botocore retries
+            disabled, otherwise every attempt here is itself retried and throttles are hidden from the limit.
+        model_id : str
+            Embedding model, e.g. amazon.titan-embed-text-v1.
+        max_workers : int
+            Maximum number of embedding requests in flight.
+        max_attempts : int
+            Attempts per chunk before giving up on the document.
+        """
+        self.client = client
+        self.model_id = model_id
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.limit = AdaptiveLimit(max_workers)
+        self.last_run = None
+
+    def _embed(self, text):
+        for attempt in range(self.max_attempts):
+            try:
+                with self.limit:
+                    response = self.client.invoke_model(modelId=self.model_id, body=json.dumps({"inputText": text}))
+                    vector = json.loads(response['body'].read())['embedding']
+                self.limit.on_success()
+                return vector
+            except Exception as e:
+                throttled = is_throttling(e)
+                if not (throttled or is_transient(e)) or attempt == self.max_attempts - 1:
+                    raise
+                if throttled:
+                    self.limit.on_throttle()
+                time.sleep(BASE_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        throttles = self.limit.throttles
+        start_time = time.perf_counter()
+        with span('document.embed_concurrent', chunks=len(texts), max_workers=self.max_workers) as current:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                vectors = list(executor.map(self._embed, texts))
+            elapsed = time.perf_counter() - start_time
+            self.last_run = {
+                'chunks': len(texts),
+                'seconds': elapsed,
+                'chunks_per_second': len(texts) / max(elapsed, 1e-9),
+                'throttles': self.limit.throttles - throttles,
+                'final_concurrency': self.limit.limit,
+            }
+            for key, value in self.last_run.items():
+                current.set(key, value)
+        print(f"Embedded {len(texts)} chunks in {elapsed:.1f}s ({self.last_run['chunks_per_second']:.1f} chunks/s, {self.last_run['throttles']} throttled)")
+        return vectors
+
+    def embed_query(self, text):
+        return self._embed(text)
@@ -0,0 +1,194 @@
+from utils.cache_utils import get_cache_dir
+from langchain_community.vectorstores import Chroma
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+
+# Disk space the indexed documents may use before the least recently used ones are evicted
+DOCUMENT_INDEX_QUOTA = 2 * 1024 ** 3
+# Seconds access times are kept in memory before they are written to the index
+LAST_ACCESS_FLUSH_INTERVAL = 300
+
+def file_hash(data: bytes):
+    return hashlib.sha256(data).hexdigest()
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+class DocumentIndex:
+    def __init__(self, embeddings, path=None, quota_bytes=DOCUMENT_INDEX_QUOTA):
+        """
+        Persistent vector index of uploaded documents keyed by the hash of the file's content.
+        Each document gets its own Chroma collection and directory, so a known document is served
+        without being parsed or embedded again, and evicting one is a directory removal.
+        Summaries generated for a document are kept alongside its vectors.
+
+        Parameters
+        ----------
+        embeddings : Embeddings
+            Embeddings the collections are built and queried with.
+        path : str
+            Directory the index lives in, defaults to the shared cache directory.
+        quota_bytes : int
+            Disk space the collections may use, least recently used documents are evicted past it.
+        """
+        self.embeddings = embeddings
+        self.path = path if path is not None else get_cache_dir("documents")
+        self.quota_bytes = quota_bytes
+        self._meta_file = os.path.join(self.path, "index.json")
+        self._stores = {}
+        self._ingest_locks = {}
+        # Access times not written yet, the index is rewritten with them in batches or when it changes anyway
+        self._last_access = {}
+        self._last_flush = time.time()
+        self._lock = threading.RLock()
+
+    def _read_meta(self):
+        try:
+            with open(self._meta_file, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_meta(self, meta):
+        # Write to a temporary file first so readers never see a half written index
+        tmp_file = self._meta_file + f".{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_file, self._meta_file)
+
+    def _merge_last_access(self, meta):
+        for doc_hash, last_access in self._last_access.items():
+            if doc_hash in meta:
+                meta[doc_hash]['last_access'] = max(meta[doc_hash]['last_access'], last_access)
+        self._last_access = {}
+        self._last_flush = time.time()
+        return meta
+
+    def flush(self):
+        """
+        Writes the access times recorded in memory to the index.
+        """
+        with self._lock:
+            if self._last_access:
+                self._write_meta(self._merge_last_access(self._read_meta()))
+
+    def _open(self, doc_hash, entry):
+        store = self._stores.get(doc_hash)
+        if store is None:
+            store = Chroma(collection_name=f"document_{doc_hash[:32]}",
+                           embedding_function=self.embeddings,
+                           persist_directory=os.path.join(self.path, entry['directory']))
+            self._stores[doc_hash] = store
+        return store
+
+    def get(self, doc_hash):
+        """
+        Returns the vector store of an indexed document, or None if the document is not known.
+        """
+        with self._lock:
+            entry = self._read_meta().get(doc_hash)
+            if entry is None or not os.path.isdir(os.path.join(self.path, entry['directory'])):
+                return None
+            self._last_access[doc_hash] = time.time()
+            if time.time() - self._last_flush > LAST_ACCESS_FLUSH_INTERVAL:
+                self.flush()
+            return self._open(doc_hash, entry)
+
+    def ingest_lock(self, doc_hash):
+        """
+        Lock held while a document is ingested, so sessions uploading the same file index it only once.
+        """
+        with self._lock:
+            return self._ingest_locks.setdefault(doc_hash, threading.Lock())
+
+    def add(self, doc_hash, name, batches):
+        """
+        Indexes a document from batches of chunks, e.g. streamed while the document is still being parsed,
+        and returns its vector store. Old documents are evicted past the quota.
+        """
+        directory = f"{doc_hash[:32]}_{uuid.uuid4().hex[:8]}"
+        store = Chroma(collection_name=f"document_{doc_hash[:32]}",
+                       embedding_function=self.embeddings,
+                       persist_directory=os.path.join(self.path, directory))
+        chunks = 0
+        try:
+            for batch in batches:
+                store.add_documents(batch)
+                chunks += len(batch)
+        except Exception:
+            # A half indexed document is never served
+            shutil.rmtree(os.path.join(self.path, directory), ignore_errors=True)
+            raise
+        now = time.time()
+        with self._lock:
+            meta = self._merge_last_access(self._read_meta())
+            meta[doc_hash] = {
+                'name': name,
+                'directory': directory,
+                'chunks': chunks,
+                'size': directory_size(os.path.join(self.path, directory)),
+                'created_at': now,
+                'last_access': now,
+                'summaries': {},
+            }
+            self._write_meta(meta)
+            self._stores[doc_hash] = store
+            self.evict(keep=doc_hash)
+        return store
+
+    def get_chunks(self, doc_hash):
+        """
+        Returns the text of every chunk of an indexed document in document order, without embedding anything.
+        """
+        store = self.get(doc_hash)
+        if store is None:
+            return []
+        data = store.get(include=['documents', 'metadatas'])
+        chunks = sorted(zip(data['metadatas'], data['documents']),
+                        key=lambda chunk: ((chunk[0] or {}).get('page', 0), (chunk[0] or {}).get('chunk', 0)))
+        return [text for _, text in chunks]
+
+    def get_summary(self, doc_hash, mode):
+        with self._lock:
+            entry = self._read_meta().get(doc_hash)
+        return entry['summaries'].get(mode) if entry is not None else None
+
+    def put_summary(self, doc_hash, mode, summary):
+        with self._lock:
+            meta = self._merge_last_access(self._read_meta())
+            if doc_hash in meta:
+                meta[doc_hash]['summaries'][mode] = summary
+                self._write_meta(meta)
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used documents until the index fits in its quota.
+        """
+        with self._lock:
+            meta = self._merge_last_access(self._read_meta())
+            total = sum(entry['size'] for entry in meta.values())
+            for doc_hash, entry in sorted(meta.items(), key=lambda item: item[1]['last_access']):
+                if total <= self.quota_bytes:
+                    break
+                if doc_hash == keep:
+                    continue
+                print(f"Evicting document {entry['name']} from the index")
+                self._stores.pop(doc_hash, None)
+                shutil.rmtree(os.path.join(self.path, entry['directory']), ignore_errors=True)
+                total -= entry['size']
+                meta.pop(doc_hash)
+            self._write_meta(meta)
+
+    def stats(self):
+        with self._lock:
+            meta = self._read_meta()
+        return {
+            'documents': len(meta),
+            'bytes': sum(entry['size'] for entry in meta.values()),
+            'quota_bytes': self.quota_bytes,
+        }
@@ -0,0 +1,141 @@
+from utils.cache_utils import get_cache_dir, connect_sqlite
+from langchain_core.embeddings import Embeddings
+import os
+import time
+import hashlib
+import threading
+import numpy as np
+
+# Least recently used vectors are evicted past this many, about 6KB each for Titan
+MAX_EMBEDDINGS = 50000
+# Keys per SQL statement, below SQLite's limit on bound parameters
+SQL_BATCH_SIZE = 500
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    def __init__(self, path=None, max_entries=MAX_EMBEDDINGS):
+        """
+        Content-addressed on-disk store of embeddings keyed by (model id, chunk hash),
+        shared by every process on the machine. Vectors are stored as float32 blobs.
+
+        Parameters
+        ----------
+        path : str
+            Location of the SQLite file, defaults to the shared cache directory.
+        max_entries : int
+            Maximum number of vectors kept, least recently used ones are evicted first.
+        """
+        self.path = path if path is not None else os.path.join(get_cache_dir("embeddings"), "embeddings.sqlite")
+        self.max_entries = max_entries
+        self._create_tables()
+
+    def _connect(self):
+        return connect_sqlite(self.path)
+
+    def _create_tables(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model_id TEXT,
+                    hash TEXT,
+                    vector BLOB,
+                    last_access REAL,
+                    PRIMARY KEY (model_id, hash)
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+
+    def get_many(self, model_id, hashes):
+        """
+        Returns the cached vectors of the given chunk hashes as a dict, missing hashes are left out.
+        """
+        hashes = list(dict.fromkeys(hashes))
+        found = {}
+        conn = self._connect()
+        with conn:
+            for start in range(0, len(hashes), SQL_BATCH_SIZE):
+                batch = hashes[start:start + SQL_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(f"SELECT hash, vector FROM embeddings WHERE model_id = ? AND hash IN ({placeholders})",
+                                    (model_id, *batch)).fetchall()
+                found.update((hash_, np.frombuffer(vector, dtype=np.float32)) for hash_, vector in rows)
+                conn.execute(f"UPDATE embeddings SET last_access = ? WHERE model_id = ? AND hash IN ({placeholders})",
+                             (time.time(), model_id, *batch))
+        return found
+
+    def put_many(self, model_id, vectors: dict):
+        """
+        Stores vectors keyed by chunk hash, evicting the least recently used ones if the cache is full.
+        """
+        if not vectors:
+            return
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings (model_id, hash, vector, last_access) VALUES (?, ?, ?, ?)",
+                             [(model_id, hash_, np.asarray(vector, dtype=np.float32).tobytes(), now) for hash_, vector in vectors.items()])
+            overflow = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute("DELETE FROM embeddings WHERE rowid IN "
+                             "(SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)", (overflow,))
+
+    def size(self):
+        return self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache():
+    """
+    Process-wide embedding cache, created on first use.
+    """
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+        return _embedding_cache
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings: Embeddings, model_id, cache: EmbeddingCache = None):
+        """
+        Wraps LangChain embeddings so only chunks never embedded with model_id before are sent to the model,
+        e.g. when the same annual report, or one overlapping with last year's, is uploaded again.
+
+        Parameters
+        ----------
+        embeddings : Embeddings
+            Embeddings computing the vectors missing from the cache.
+        model_id : str
+            Model the vectors come from, part of the cache key.
+        cache : EmbeddingCache
+            Cache the vectors are read from and written to, defaults to the process-wide cache.
+        """
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.cache = cache if cache is not None else get_embedding_cache()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        hashes = [chunk_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model_id, hashes)
+        # Identical chunks within a document are only embedded once
+        missing = {hash_: text for hash_, text in zip(hashes, texts) if hash_ not in vectors}
+        if missing:
+            computed = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            self.cache.put_many(self.model_id, computed)
+            vectors.update(computed)
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return [np.asarray(vectors[hash_], dtype=np.float32).tolist() for hash_ in hashes]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': self.cache.size()}
@@ -0,0 +1,106 @@
+from scripts.web_search.contextBudget import estimate_tokens
+from utils.tracing import span
+import time
+import concurrent.futures
+
+# Summaries generated at once, each is one LLM call
+MAX_SUMMARY_WORKERS = 4
+# Tokens of document text or partial summaries sent in one call, well inside Titan Text's context window
+GROUP_TOKENS = 3000
+
+MAP_PROMPT = """You are a financial analyst. Summarize the following excerpt of a financial document.
+Keep the key financial metrics and figures, business performance, risks, strategic initiatives and outlook statements.
+
+Excerpt: {context}
+
+Summary:"""
+
+REDUCE_PROMPT = """You are a financial analyst. Combine the following partial summaries of consecutive parts of a financial document
+into one summary. Keep the key financial metrics and figures, business performance, risks, strategic initiatives and outlook statements.
+
+Partial summaries: {context}
+
+Combined summary:"""
+
+def group_texts(texts, max_tokens):
+    """
+    Packs consecutive texts into groups of at most max_tokens, a text longer than that gets a group of its own.
+    """
+    groups = []
+    group, group_tokens = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if group and group_tokens + tokens > max_tokens:
+            groups.append(group)
+            group, group_tokens = [], 0
+        group.append(text)
+        group_tokens += tokens
+    if group:
+        groups.append(group)
+    return groups
+
+class MapReduceSummarizer:
+    def __init__(self, llm, final_prompt, max_workers=MAX_SUMMARY_WORKERS, group_tokens=GROUP_TOKENS):
+        """
+        Summarizes a whole document: groups of chunks are summarized in parallel (map), then the partial
+        summaries are combined level by level (tree reduce) until they fit in one final call.
+
+        Parameters
+        ----------
+        llm : LLM
+            LangChain LLM the summaries are generated with.
+        final_prompt : str
+            Prompt of the last call, with a {context} placeholder for the remaining partial summaries.
+        max_workers : int
+            Maximum number of LLM calls in flight.
+        group_tokens : int
+            Maximum number of input tokens per call.
+        """
+        self.llm = llm
+        self.final_prompt = final_prompt
+        self.max_workers = max_workers
+        self.group_tokens = group_tokens
+
+    def _summarize_groups(self, prompt, groups):
+        # executor.map keeps the summaries in document order
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(lambda group: self.llm.invoke(prompt.format(context="\n\n".join(group))), groups))
+
+    def summarize(self, chunks):
+        """
+        Returns the summary of the chunks of a document, in document order, and the timings of each stage.
+        """
+        if not chunks:
+            raise ValueError("The document has no text to summarize")
+        timings = {'chunks': len(chunks), 'reduce_levels': []}
+        start_time = time.perf_counter()
+
+        with span('document.map', chunks=len(chunks)) as current:
+            groups = group_texts(chunks, self.group_tokens)
+            partials = self._summarize_groups(MAP_PROMPT, groups)
+            current.set('groups', len(groups))
+        timings['map_groups'] = len(groups)
+        timings['map'] = time.perf_counter() - start_time
+
+        while True:
+            groups = group_texts(partials, self.group_tokens)
+            if len(groups) == 1:
+                break
+            if len(groups) == len(partials):
+                # Every partial summary fills a call on its own, pairing them still halves the level
+                groups = [partials[index:index + 2] for index in range(0, len(partials), 2)]
+                if len(groups) == 1:
+                    break
+            level_start = time.perf_counter()
+            with span('document.reduce', level=len(timings['reduce_levels']) + 1, groups=len(groups)):
+                partials = self._summarize_groups(REDUCE_PROMPT, groups)
+            timings['reduce_levels'].append({'groups': len(groups), 'seconds': time.perf_counter() - level_start})
+
+        final_start = time.perf_counter()
+        with span('document.final_summary', partials=len(groups[0])):
+            summary = self.llm.invoke(self.final_prompt.format(context="\n\n".join(groups[0])))
+        timings['final'] = time.perf_counter() - final_start
+        timings['total'] = time.perf_counter() - start_time
+        print(f"Map-reduce summary of {len(chunks)} chunks in {timings['total']:.1f}s "
+              f"({timings['map_groups']} groups, {len(timings['reduce_levels'])} reduce levels)")
+        return summary, timings
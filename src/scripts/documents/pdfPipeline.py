@@ -0,0 +1,115 @@
+from langchain_core.documents import Document
+from pypdf import PdfReader
+import io
+import queue
+import threading
+
+# Chunks sent to the embedding stage at once
+EMBED_BATCH_SIZE = 64
+# Batches parsed ahead of the embedding stage, bounds the memory held by the pipeline
+MAX_BUFFERED_BATCHES = 4
+
+def iter_pages(data: bytes, source=None):
+    """
+    Yields the pages of a PDF held in memory one at a time, in the format of PyPDFLoader.
+    """
+    reader = PdfReader(io.BytesIO(data))
+    for number, page in enumerate(reader.pages):
+        yield Document(page_content=page.extract_text() or "", metadata={'source': source, 'page': number})
+
+def iter_chunks(pages, text_splitter):
+    """
+    Splits pages into chunks as they arrive, the same chunks as splitting the whole document at once.
+    Chunks are numbered in document order.
+    """
+    number = 0
+    for page in pages:
+        for chunk in text_splitter.split_documents([page]):
+            chunk.metadata['chunk'] = number
+            number += 1
+            yield chunk
+
+def iter_batches(items, batch_size=EMBED_BATCH_SIZE):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+_DONE = object()
+
+def prefetch(iterable, max_buffered=MAX_BUFFERED_BATCHES):
+    """
+    Runs iterable in a background thread, at most max_buffered items ahead of the consumer,
+    so producing the next items overlaps with consuming the current one.
+    Errors of the producer are raised in the consumer.
+    """
+    buffer = queue.Queue(maxsize=max_buffered)
+    stopped = threading.Event()
+
+    def put(item):
+        # Waits for room in the buffer unless the consumer is gone, returns whether the item was queued
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # The consumer stopped early or failed, let the producer exit instead of blocking on the full buffer
+        stopped.set()
+
+class PdfStats():
+    def __init__(self):
+        """
+        Counts updated by the pipeline as pages and chunks go through it.
+        """
+        self.pages = 0
+        self.chunks = 0
+        self.batches = 0
+
+def pdf_chunk_batches(data: bytes, text_splitter, source=None, batch_size=EMBED_BATCH_SIZE,
+                      max_buffered=MAX_BUFFERED_BATCHES, stats: PdfStats = None):
+    """
+    Streams an uploaded PDF as batches of chunks: pages are parsed and split in a background thread
+    while the caller embeds and indexes the previous batches.
+    """
+    stats = stats if stats is not None else PdfStats()
+
+    def count_pages(pages):
+        for page in pages:
+            stats.pages += 1
+            yield page
+
+    def count_batches(batches):
+        for batch in batches:
+            stats.batches += 1
+            stats.chunks += len(batch)
+            yield batch
+
+    batches = iter_batches(iter_chunks(count_pages(iter_pages(data, source)), text_splitter), batch_size)
+    return prefetch(count_batches(batches), max_buffered)
@@ -0,0 +1,4 @@
+from .tickerDataCache import TickerDataCache, get_ticker_data_cache
+from .priceHistoryStore import PriceHistoryStore, get_price_history_store
+from .multiTickerInsights import MultiTickerInsights
+from .relatedTickers import get_related_tickers
@@ -0,0 +1,77 @@
+from .tickerDataCache import get_ticker_data_cache
+from .priceHistoryStore import get_price_history_store
+import pandas as pd
+import concurrent.futures
+
+# Fields of the yfinance info shown when comparing tickers
+SUMMARY_FIELDS = ['longName',
+                  'sector',
+                  'industry',
+                  'country',
+                  'currentPrice',
+                  'marketCap',
+                  'trailingPE',
+                  'forwardPE',
+                  'dividendYield',
+                  'beta',
+                  'fiftyTwoWeekHigh',
+                  'fiftyTwoWeekLow']
+# Maximum number of tickers whose info is fetched at once
+MAX_WORKERS = 8
+
+class MultiTickerInsights:
+    def __init__(self, tickers: list, max_workers=MAX_WORKERS):
+        """
+        Insights on several tickers at once, e.g. a company and its peers.
+        Infos are fetched with a bounded thread pool and price histories with batched downloads.
+        """
+        self.tickers : list = list(dict.fromkeys(ticker.strip().upper() for ticker in tickers if ticker.strip()))
+        self.max_workers = max_workers
+        self.data_cache = get_ticker_data_cache()
+        self.price_store = get_price_history_store()
+
+    def get_summaries(self):
+        """
+        Returns the yfinance info of every ticker, tickers that fail to load are left out.
+        """
+        summaries = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.data_cache.get, ticker, 'info'): ticker for ticker in self.tickers}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    summaries[futures[future]] = future.result()
+                except Exception as e:
+                    print(f"Could not load info for {futures[future]}: {str(e)}")
+        return {ticker: summaries[ticker] for ticker in self.tickers if ticker in summaries}
+
+    def get_summary_table(self, fields=SUMMARY_FIELDS):
+        """
+        Returns the selected info fields as a DataFrame indexed by ticker.
+        """
+        summaries = self.get_summaries()
+        rows = {ticker: {field: info.get(field) for field in fields} for ticker, info in summaries.items()}
+        return pd.DataFrame.from_dict(rows, orient='index', columns=fields).rename_axis('Ticker')
+
+    def get_historical_data(self, period='1y'):
+        """
+        Returns the daily bars of every ticker as one DataFrame indexed by (ticker, date).
+        """
+        return self.price_store.load_many(self.tickers, period)
+
+    def get_close_prices(self, period='1y'):
+        """
+        Returns the closing prices with one column per ticker, aligned on date.
+        """
+        history = self.get_historical_data(period)
+        if history.empty:
+            return history
+        return history['Close'].unstack('Ticker').sort_index()
+
+    def get_relative_performance(self, period='1y'):
+        """
+        Returns the closing prices rebased to 1 at the first date every ticker traded.
+        """
+        closes = self.get_close_prices(period).dropna()
+        if closes.empty:
+            return closes
+        return closes / closes.iloc[0]
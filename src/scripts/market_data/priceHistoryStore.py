@@ -0,0 +1,242 @@
+from utils.cache_utils import get_cache_dir
+from utils.fake_backends import get_yf_ticker, yf_download
+from utils.tracing import traced
+import pandas as pd
+import os
+import json
+import time
+import threading
+
+# How far back each yfinance period goes, 'ytd' and 'max' are handled separately
+PERIOD_OFFSETS = {
+    '1d': pd.DateOffset(days=1),
+    '5d': pd.DateOffset(days=5),
+    '1mo': pd.DateOffset(months=1),
+    '3mo': pd.DateOffset(months=3),
+    '6mo': pd.DateOffset(months=6),
+    '1y': pd.DateOffset(years=1),
+    '2y': pd.DateOffset(years=2),
+    '5y': pd.DateOffset(years=5),
+    '10y': pd.DateOffset(years=10),
+}
+# Period downloaded the first time a ticker is seen, so shorter periods are served locally afterwards
+INITIAL_PERIOD = '5y'
+# Seconds before the latest bars are downloaded again
+REFRESH_INTERVAL = 15 * 60
+
+def period_start(period):
+    """
+    First date covered by a yfinance period, None for 'max'.
+    """
+    today = pd.Timestamp.now().normalize()
+    if period == 'max':
+        return None
+    if period == 'ytd':
+        return today.replace(month=1, day=1)
+    return today - PERIOD_OFFSETS[period]
+
+def _clean(df):
+    # Daily bars are stored without a timezone so histories from history() and download() line up
+    df = df.dropna(how='all').copy()
+    if getattr(df.index, 'tz', None) is not None:
+        df.index = df.index.tz_localize(None)
+    df.index = df.index.normalize()
+    df.index.name = 'Date'
+    return df[~df.index.duplicated(keep='last')].sort_index()
+
+def _has_corporate_actions(tail, last_stored):
+    """
+    Whether bars downloaded after last_stored include a split or dividend. Bars are auto-adjusted as of
+    their download, so such an action invalidates the stored bars before it.
+    """
+    tail = _clean(tail)
+    tail = tail[tail.index > last_stored]
+    columns = [column for column in ('Dividends', 'Stock Splits') if column in tail.columns]
+    return bool(columns) and bool((tail[columns].fillna(0) != 0).any().any())
+
+class PriceHistoryStore:
+    def __init__(self, path=None, refresh_interval=REFRESH_INTERVAL):
+        """
+        Local columnar store of daily OHLCV bars, one Parquet file per ticker.
+        The first request downloads INITIAL_PERIOD (or more if asked), later ones only download
+        the bars missing since the last refresh, and any period is served by slicing the local file.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the Parquet files, defaults to the shared cache directory.
+        refresh_interval : float
+            Seconds before the latest bars of a ticker are downloaded again.
+        """
+        self.path = path if path is not None else get_cache_dir("price_history")
+        self.refresh_interval = refresh_interval
+        self.downloads = 0
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _file(self, ticker):
+        return os.path.join(self.path, f"{ticker.upper()}.parquet")
+
+    def _meta_file(self, ticker):
+        return os.path.join(self.path, f"{ticker.upper()}.json")
+
+    def _ticker_lock(self, ticker):
+        with self._lock:
+            return self._locks.setdefault(ticker.upper(), threading.Lock())
+
+    def _read_meta(self, ticker):
+        try:
+            with open(self._meta_file(ticker)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def load(self, ticker):
+        """
+        Returns the locally stored bars of a ticker without touching the network, None if there are none.
+        """
+        try:
+            return pd.read_parquet(self._file(ticker))
+        except (FileNotFoundError, OSError):
+            return None
+
+    def save(self, ticker, df, coverage):
+        """
+        Stores the bars of a ticker, coverage is the period the bars are known to cover.
+        """
+        df = _clean(df)
+        tmp_file = self._file(ticker) + f".{os.getpid()}.tmp"
+        df.to_parquet(tmp_file)
+        os.replace(tmp_file, self._file(ticker))
+        with open(self._meta_file(ticker), 'w') as f:
+            json.dump({'coverage': coverage, 'refreshed_at': time.time()}, f)
+        return df
+
+    def _covers(self, meta, period):
+        if meta is None:
+            return False
+        if meta['coverage'] == 'max':
+            return True
+        if period == 'max':
+            return False
+        return period_start(meta['coverage']) <= period_start(period)
+
+    def _is_stale(self, meta):
+        return meta is None or time.time() - meta['refreshed_at'] > self.refresh_interval
+
+    def _wider_period(self, period):
+        if period == 'max':
+            return 'max'
+        return period if period_start(period) < period_start(INITIAL_PERIOD) else INITIAL_PERIOD
+
+    @traced('yfinance.history')
+    def _download(self, ticker, **kwargs):
+        with self._lock:
+            self.downloads += 1
+        return get_yf_ticker(ticker).history(**kwargs)
+
+    def refresh(self, ticker, period='1y'):
+        """
+        Makes sure the local bars of a ticker cover period and are up to date, downloading as little as possible.
+        """
+        with self._ticker_lock(ticker):
+            meta = self._read_meta(ticker)
+            df = self.load(ticker)
+            if df is None or df.empty or not self._covers(meta, period):
+                coverage = self._wider_period(period)
+                return self.save(ticker, self._download(ticker, period=coverage), coverage)
+            if self._is_stale(meta):
+                # The last stored bar may have been partial, so it is downloaded again
+                tail = self._download(ticker, start=df.index[-1].strftime('%Y-%m-%d'))
+                if _has_corporate_actions(tail, df.index[-1]):
+                    # Appending would leave a break in the series, the whole range is downloaded adjusted again
+                    return self.save(ticker, self._download(ticker, period=meta['coverage']), meta['coverage'])
+                if not tail.empty:
+                    df = pd.concat([df, _clean(tail)])
+                return self.save(ticker, df, meta['coverage'])
+            return df
+
+    def get_history(self, ticker, period='1y'):
+        """
+        Returns the bars of a ticker over period, served from the local store.
+        """
+        df = self.refresh(ticker, period)
+        start = period_start(period)
+        return df if start is None else df[df.index >= start]
+
+    def refresh_many(self, tickers, period='1y'):
+        """
+        Brings many tickers up to date with one batched download for the missing ones
+        and one for the stale ones.
+        """
+        tickers = [ticker.upper() for ticker in dict.fromkeys(tickers)]
+        metas = {ticker: self._read_meta(ticker) for ticker in tickers}
+        missing = [ticker for ticker in tickers if not self._covers(metas[ticker], period) or not os.path.exists(self._file(ticker))]
+        stale = [ticker for ticker in tickers if ticker not in missing and self._is_stale(metas[ticker])]
+        frames = {ticker: self.load(ticker) for ticker in stale}
+        # Tickers whose stored bars are empty have no last bar to refresh from, they are downloaded again in full
+        missing += [ticker for ticker in stale if frames[ticker] is None or frames[ticker].empty]
+        stale = [ticker for ticker in stale if ticker not in missing]
+
+        if missing:
+            coverage = self._wider_period(period)
+            data = self._batch_download(missing, period=coverage)
+            for ticker in missing:
+                if ticker in data and not data[ticker].empty:
+                    with self._ticker_lock(ticker):
+                        self.save(ticker, data[ticker], coverage)
+        if stale:
+            start = min(frames[ticker].index[-1] for ticker in stale).strftime('%Y-%m-%d')
+            data = self._batch_download(stale, start=start)
+            readjust = {}
+            for ticker in stale:
+                if ticker in data and not data[ticker].empty:
+                    if _has_corporate_actions(data[ticker], frames[ticker].index[-1]):
+                        readjust.setdefault(metas[ticker]['coverage'], []).append(ticker)
+                        continue
+                    with self._ticker_lock(ticker):
+                        self.save(ticker, pd.concat([frames[ticker], _clean(data[ticker])]), metas[ticker]['coverage'])
+            # Tickers with a split or dividend in their new bars are downloaded adjusted over their whole range
+            for coverage, readjust_tickers in readjust.items():
+                data = self._batch_download(readjust_tickers, period=coverage)
+                for ticker in readjust_tickers:
+                    if ticker in data and not data[ticker].empty:
+                        with self._ticker_lock(ticker):
+                            self.save(ticker, data[ticker], coverage)
+
+    @traced('yfinance.download', record_result_size=False)
+    def _batch_download(self, tickers, **kwargs):
+        with self._lock:
+            self.downloads += 1
+        data = yf_download(tickers, group_by='ticker', auto_adjust=True, actions=True, threads=True, progress=False, **kwargs)
+        if isinstance(data.columns, pd.MultiIndex):
+            return {ticker: data[ticker].dropna(how='all') for ticker in tickers if ticker in data.columns.get_level_values(0)}
+        return {tickers[0]: data}
+
+    def load_many(self, tickers, period='1y'):
+        """
+        Returns the bars of many tickers over period as one DataFrame indexed by (ticker, date).
+        """
+        self.refresh_many(tickers, period)
+        start = period_start(period)
+        frames = {}
+        for ticker in dict.fromkeys(ticker.upper() for ticker in tickers):
+            df = self.load(ticker)
+            if df is not None:
+                frames[ticker] = df if start is None else df[df.index >= start]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, names=['Ticker', 'Date'])
+
+_price_history_store = None
+_price_history_store_lock = threading.Lock()
+
+def get_price_history_store():
+    """
+    Process-wide price history store, created on first use.
+    """
+    global _price_history_store
+    with _price_history_store_lock:
+        if _price_history_store is None:
+            _price_history_store = PriceHistoryStore()
+        return _price_history_store
@@ -0,0 +1,73 @@
+from .tickerDataCache import get_ticker_data_cache
+from utils.fake_backends import get_yf_industry
+import re
+
+# Ticker symbols written like "(MSFT)" or "NASDAQ: MSFT" in search answers, the first also matches acronyms
+# such as "(AI)" so its matches are checked against Yahoo before being used
+TICKER_PATTERNS = [
+    re.compile(r"\(([A-Z]{1,5}(?:\.[A-Z])?)\)"),
+    re.compile(r"(?:NASDAQ|NYSE|AMEX)\s*:\s*([A-Z]{1,5}(?:\.[A-Z])?)"),
+]
+
+def extract_tickers(text):
+    """
+    Returns the ticker symbols mentioned in a text, in order of appearance.
+    """
+    if not text:
+        return []
+    matches = sorted((match.start(), match.group(1)) for pattern in TICKER_PATTERNS for match in pattern.finditer(text))
+    return list(dict.fromkeys(symbol for _, symbol in matches))
+
+def get_competitor_tickers(system_instructs):
+    """
+    Returns the tickers mentioned in the competitors section of built system instructions.
+    """
+    if not system_instructs:
+        return []
+    section = re.search(r"### Competitors\n(.*?)(?=\n#|\Z)", system_instructs, re.DOTALL)
+    return extract_tickers(section.group(1)) if section else []
+
+def is_listed_equity(symbol):
+    """
+    Whether Yahoo knows the symbol as a stock, from the cached info of the ticker.
+    """
+    try:
+        info = get_ticker_data_cache().get(symbol, 'info')
+    except Exception as e:
+        print(f"Could not check ticker {symbol}: {str(e)}")
+        return False
+    return bool(info) and info.get('quoteType') == 'EQUITY' and bool(info.get('longName'))
+
+def fetch_industry_peers(industry_key, dataset=None, period=None):
+    return list(get_yf_industry(industry_key).top_companies.index)
+
+def get_industry_peers(info: dict):
+    """
+    Returns the largest companies of the ticker's industry according to Yahoo.
+    """
+    industry_key = info.get('industryKey')
+    if not industry_key:
+        return []
+    try:
+        return get_ticker_data_cache().get(industry_key, 'industry_peers', fetch=fetch_industry_peers)
+    except Exception as e:
+        print(f"Could not load industry peers for {industry_key}: {str(e)}")
+        return []
+
+def get_related_tickers(ticker, info: dict, system_instructs=None, limit=5):
+    """
+    Tickers a user looking at ticker is likely to open next: its competitors first, then its industry peers.
+    Competitors found in the search answers are only kept if Yahoo lists them as stocks.
+    """
+    candidates = [(symbol.upper(), True) for symbol in get_competitor_tickers(system_instructs)]
+    candidates += [(symbol.upper(), False) for symbol in get_industry_peers(info)]
+    related = []
+    for symbol, needs_check in candidates:
+        if len(related) == limit:
+            break
+        if symbol == ticker.upper() or symbol in related:
+            continue
+        if needs_check and not is_listed_equity(symbol):
+            continue
+        related.append(symbol)
+    return related
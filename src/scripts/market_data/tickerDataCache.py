@@ -0,0 +1,140 @@
+from utils.cache_utils import get_cache_dir
+from utils.fake_backends import get_yf_ticker
+from utils.tracing import traced, current_span
+import os
+import time
+import pickle
+import threading
+import concurrent.futures
+
+# Seconds each yfinance dataset stays valid
+DATASET_TTLS = {
+    'info': 15 * 60,
+    'history': 15 * 60,
+    'recommendations': 24 * 3600,
+    'income_stmt': 24 * 3600,
+    'dividends': 24 * 3600,
+    'industry_peers': 24 * 3600,
+}
+
+@traced('yfinance.fetch_dataset')
+def fetch_dataset(ticker, dataset, period=None):
+    """
+    Downloads one dataset of a ticker from yfinance.
+    """
+    current_span().set('ticker', ticker)
+    current_span().set('dataset', dataset)
+    ticker_obj = get_yf_ticker(ticker)
+    if dataset == 'history':
+        return ticker_obj.history(period=period)
+    return getattr(ticker_obj, dataset)
+
+class TickerDataCache:
+    def __init__(self, path=None, ttls: dict = None):
+        """
+        Cache of yfinance data keyed by (ticker, dataset, period), kept in memory for the Streamlit
+        sessions of this process and pickled to disk for the executor worker processes.
+        Concurrent requests for the same key in a process share a single download.
+
+        Parameters
+        ----------
+        path : str
+            Directory the datasets are pickled to, defaults to the shared cache directory.
+        ttls : dict
+            Seconds each dataset stays valid, merged over DATASET_TTLS.
+        """
+        self.path = path if path is not None else get_cache_dir("ticker_data")
+        self.ttls = {**DATASET_TTLS, **(ttls or {})}
+        self.fetches = 0
+        self._memory = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _file(self, key):
+        ticker, dataset, period = key
+        name = f"{dataset}_{period}.pkl" if period else f"{dataset}.pkl"
+        return os.path.join(self.path, ticker, name)
+
+    def _read_disk(self, key, ttl):
+        file = self._file(key)
+        try:
+            fetched_at = os.path.getmtime(file)
+            if time.time() - fetched_at > ttl:
+                return None
+            with open(file, 'rb') as f:
+                return pickle.load(f), fetched_at
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def _write_disk(self, key, value):
+        file = self._file(key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        tmp_file = file + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(value, f)
+        os.replace(tmp_file, file)
+
+    def get(self, ticker, dataset, period=None, fetch=fetch_dataset):
+        """
+        Returns the dataset of a ticker, downloading it only if no fresh copy is in memory or on disk.
+        """
+        key = (ticker.upper(), dataset, period)
+        ttl = self.ttls.get(dataset, 0)
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None and time.time() - cached[1] <= ttl:
+                return cached[0]
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = concurrent.futures.Future()
+                self._in_flight[key] = future
+        if not owner:
+            return future.result()
+
+        try:
+            cached = self._read_disk(key, ttl)
+            if cached is None:
+                value = fetch(ticker, dataset, period)
+                self._write_disk(key, value)
+                cached = (value, time.time())
+                with self._lock:
+                    self.fetches += 1
+        except Exception as e:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._memory[key] = cached
+            self._in_flight.pop(key, None)
+        future.set_result(cached[0])
+        return cached[0]
+
+    def invalidate(self, ticker, dataset=None):
+        """
+        Forgets the cached datasets of a ticker, all of them if dataset is None.
+        """
+        ticker = ticker.upper()
+        with self._lock:
+            for key in [key for key in self._memory if key[0] == ticker and dataset in (None, key[1])]:
+                self._memory.pop(key)
+            ticker_dir = os.path.join(self.path, ticker)
+            if os.path.isdir(ticker_dir):
+                for name in os.listdir(ticker_dir):
+                    if dataset is None or name == f"{dataset}.pkl" or name.startswith(f"{dataset}_"):
+                        os.remove(os.path.join(ticker_dir, name))
+
+_ticker_data_cache = None
+_ticker_data_cache_lock = threading.Lock()
+
+def get_ticker_data_cache():
+    """
+    Process-wide ticker data cache, created on first use.
+    """
+    global _ticker_data_cache
+    with _ticker_data_cache_lock:
+        if _ticker_data_cache is None:
+            _ticker_data_cache = TickerDataCache()
+        return _ticker_data_cache
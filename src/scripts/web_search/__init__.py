@@ -1,2 +1,5 @@
 from .companyChatbot import companyChatbot as ChatBot
-from .companyWebSearch import initialLLMContext
\ No newline at end of file
+from .companyChatbot import build_ticker_instructs
+from .companyWebSearch import initialLLMContext
+from .contextStore import contextStore
+from .responseCache import responseCache, bedrock_embed
@@ -0,0 +1,151 @@
+from .companyChatbot import build_ticker_instructs
+from .companyWebSearch import companyWebSearch
+from .contextStore import contextStore
+from .searchLimiter import searchLimiter
+from utils.cache_utils import get_cache_dir
+from utils.fake_backends import get_yf_ticker
+import os
+import json
+import time
+import argparse
+import threading
+import concurrent.futures
+
+class batchContextBuilder():
+    def __init__(self,
+                 tickers: list,
+                 max_workers=4,
+                 max_concurrent_searches=8,
+                 searches_per_second=5,
+                 search_workers_per_ticker=4,
+                 checkpoint_path=None,
+                 run_id=None,
+                 store: contextStore = None):
+        """
+        Builds the system instructions of many tickers, e.g. to pre-warm a watchlist every morning.
+        Tickers are built in threads of a single process, so searches shared between tickers
+        (world economy, sector, industry, country) are only run once for the whole batch.
+
+        Parameters
+        ----------
+        tickers : list
+            Ticker symbols to build, duplicates are ignored.
+        max_workers : int
+            Number of tickers built at once.
+        max_concurrent_searches : int
+            Maximum number of search API calls in flight across the whole batch.
+        searches_per_second : float
+            Maximum search API call rate across the whole batch, None for no limit.
+        search_workers_per_ticker : int
+            Number of concurrent searches within a single ticker.
+        checkpoint_path : str
+            JSON file recording finished tickers so an interrupted batch can resume,
+            removed once every ticker has been built so the next batch starts from scratch.
+        run_id : str
+            Run the checkpoint belongs to, defaults to today's date. A checkpoint left by another run,
+            e.g. yesterday's pre-warm with failed tickers, is ignored so every ticker is built again.
+        store : contextStore
+            Where the finished contexts are written, defaults to the store read by the dashboard.
+        """
+        self.tickers = list(dict.fromkeys(ticker.strip().upper() for ticker in tickers if ticker.strip()))
+        self.max_workers = max_workers
+        self.search_workers_per_ticker = search_workers_per_ticker
+        self.limiter = searchLimiter(max_concurrent_searches, searches_per_second)
+        self.checkpoint_path = checkpoint_path if checkpoint_path is not None else os.path.join(get_cache_dir("batch"), "checkpoint.json")
+        self.run_id = run_id if run_id is not None else time.strftime("%Y-%m-%d")
+        self.store = store if store is not None else contextStore()
+        self._lock = threading.Lock()
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            checkpoint = None
+        if checkpoint is None or checkpoint.get('run_id') != self.run_id:
+            return {'run_id': self.run_id, 'completed': [], 'failed': {}}
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint):
+        tmp_file = self.checkpoint_path + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_file, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+
+    def build_ticker(self, ticker):
+        info = get_yf_ticker(ticker).info
+        system_instructs = build_ticker_instructs(ticker, info, max_workers=self.search_workers_per_ticker)
+        self.store.put(ticker, system_instructs, metadata={'source': 'batch'})
+        return ticker
+
+    def run(self):
+        """
+        Builds every ticker not already completed in this run's checkpoint, failed tickers are retried.
+        Returns the checkpoint once the batch is finished.
+        """
+        checkpoint = self.load_checkpoint()
+        completed = set(checkpoint['completed'])
+        pending = [ticker for ticker in self.tickers if ticker not in completed]
+        print(f"Building {len(pending)} tickers ({len(self.tickers) - len(pending)} already done)")
+
+        start_time = time.time()
+        previous_limiter = companyWebSearch.search_limiter
+        companyWebSearch.search_limiter = self.limiter
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(self.build_ticker, ticker): ticker for ticker in pending}
+                for future in concurrent.futures.as_completed(futures):
+                    ticker = futures[future]
+                    with self._lock:
+                        try:
+                            future.result()
+                            checkpoint['completed'].append(ticker)
+                            checkpoint['failed'].pop(ticker, None)
+                            status = "done"
+                        except Exception as e:
+                            print(f"Failed to build {ticker}: {str(e)}")
+                            checkpoint['failed'][ticker] = str(e)
+                            status = "failed"
+                        self.save_checkpoint(checkpoint)
+                        print(f"[{len(checkpoint['completed'])}/{len(self.tickers)}] {ticker} {status}")
+        finally:
+            companyWebSearch.search_limiter = previous_limiter
+
+        print(f"Batch finished in {time.time() - start_time:.1f}s, {len(checkpoint['failed'])} failed")
+        if not checkpoint['failed'] and set(self.tickers) <= set(checkpoint['completed']):
+            # The batch is complete, the next scheduled run must build every ticker again
+            self.clear_checkpoint()
+        return checkpoint
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-build system instructions for a list of tickers.")
+    parser.add_argument("tickers", nargs="*", help="Ticker symbols to build")
+    parser.add_argument("--file", help="File with one ticker per line")
+    parser.add_argument("--workers", type=int, default=4, help="Number of tickers built at once")
+    parser.add_argument("--max-searches", type=int, default=8, help="Maximum number of search calls in flight")
+    parser.add_argument("--searches-per-second", type=float, default=5, help="Maximum search call rate")
+    parser.add_argument("--checkpoint", help="Checkpoint file used to resume the batch")
+    parser.add_argument("--run-id", help="Run the checkpoint belongs to, defaults to today's date")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and build every ticker again")
+    args = parser.parse_args()
+
+    tickers = list(args.tickers)
+    if args.file:
+        with open(args.file) as f:
+            tickers += [line for line in f.read().splitlines() if line.strip()]
+
+    builder = batchContextBuilder(tickers,
+                                  max_workers=args.workers,
+                                  max_concurrent_searches=args.max_searches,
+                                  searches_per_second=args.searches_per_second,
+                                  checkpoint_path=args.checkpoint,
+                                  run_id=args.run_id)
+    if args.restart:
+        builder.clear_checkpoint()
+    builder.run()
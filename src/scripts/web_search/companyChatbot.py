@@ -1,7 +1,11 @@
-from .companyWebSearch import initialLLMContext
-import boto3
+from .companyWebSearch import initialLLMContext, MAX_SEARCH_WORKERS, CONTEXT_TOKEN_BUDGET
+from .conversationMemory import conversationMemory
+from utils.aws_clients import get_client
+from utils.tracing import span
 import json
 
+CLAUDE_MODEL_ID = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+
 class companyChatbot(initialLLMContext):
     def __init__(self,
                  company_ticker,
@@ -13,7 +17,9 @@ class companyChatbot(initialLLMContext):
                  board_members,
                  variables: dict,
                  search_selection: dict = None,
-                 region='us-west-2'):
+                 region='us-west-2',
+                 max_workers=MAX_SEARCH_WORKERS,
+                 context_token_budget=CONTEXT_TOKEN_BUDGET):
         """
         Parameters
         ----------
@@ -33,6 +39,10 @@ class companyChatbot(initialLLMContext):
             Dictionary containing various variables to add to the context of the LLM
         search_selection : dict
             Dictionary containing the search features to add, values are booleans. Keys must be the same as below to work properly.
+        max_workers : int
+            Maximum number of web searches run concurrently, 1 runs them sequentially.
+        context_token_budget : int
+            Maximum size of the company context in estimated tokens, None for no limit.
 
         example search_selection:
         ```
@@ -69,11 +79,14 @@ class companyChatbot(initialLLMContext):
                             company_description,
                             board_members,
                             variables,
-                            self.search_selection)
+                            self.search_selection,
+                            max_workers=max_workers,
+                            context_token_budget=context_token_budget)
         
-        # Initialize the AWS client for the Titan model
-        self.bedrock = boto3.client('bedrock-runtime', region_name=region)
-
+        # Initialize the AWS client for the Titan model, shared by every chatbot of the process
+        self.bedrock = get_client('bedrock-runtime', region_name=region)
+        # History of the chat held by this chatbot, carried from turn to turn
+        self.memory = None
 
         self.industry_name = industry_name
         self.sub_sector_name = sub_sector_name
@@ -91,6 +104,7 @@ class companyChatbot(initialLLMContext):
                                     self.country,
                                     self.board_members)
         self.system_instructs = self.build_context(search_results)
+        self.report_progress('context', tokens=self.context_report['total_tokens'])
         self.instruct_overview = f"""
         ## OVERVIEW:
         You are a helpful financial assistant that provides financial analysts with pertinent information that can help them in their analyses.\n
@@ -102,53 +116,95 @@ class companyChatbot(initialLLMContext):
         """
         self.system_instructs += self.instruct_overview
 
-    def get_llm_response(self, prompt, system_instructs, past_responses : list =None):
-        claude_model_id = "anthropic.claude-3-5-sonnet-20240620-v1:0"  
-        messages = [{
-            "role": "user",
-            "content": prompt
-        }]
-        if past_responses is not None:
-            messages = past_responses + messages
-        try:
-            # Prepare message payload for Claude
-
-            body = json.dumps({
-                "anthropic_version": "bedrock-2023-05-31", 
-                "max_tokens": 1000,
-                "system": system_instructs,
-                "messages": messages,
-                "temperature": 0.8,
-            })  
-
-            # Invoke Claude model
+    def invoke_claude(self, system_instructs, messages, max_tokens=1000, temperature=0.8):
+        """
+        Sends the messages to Claude and returns the answer text.
+        """
+        body = json.dumps({
+            "anthropic_version": "bedrock-2023-05-31", 
+            "max_tokens": max_tokens,
+            "system": system_instructs,
+            "messages": messages,
+            "temperature": temperature,
+        })  
+
+        # Invoke Claude model
+        with span('bedrock.invoke_model', model_id=CLAUDE_MODEL_ID, request_bytes=len(body)) as current:
             response = self.bedrock.invoke_model(
-                modelId=claude_model_id,
+                modelId=CLAUDE_MODEL_ID,
                 body=body
             )
 
             # Decode response
-            resp = json.loads(response['body'].read().decode('utf-8'))
+            raw = response['body'].read()
+            current.set('response_bytes', len(raw))
+        resp = json.loads(raw.decode('utf-8'))
+        return resp['content'][0]['text']
 
-            # Extract assistant response
-            prev_answer = {
-                "role": resp['role'],
-                "content": resp['content'][0]['text']
-            }
+    def summarize_turns(self, summary, turns):
+        """
+        Folds older conversation turns into the running summary, used by conversationMemory.
+        """
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for turn in turns for message in turn)
+        prompt = f"""Current summary of the conversation:\n{summary or 'None'}\n\nNew exchanges:\n{transcript}\n\n
+        Update the summary with the new exchanges. Keep the facts, figures and questions the analyst cares about, in a few short bullet points.
+        Only answer with the updated summary."""
+        return self.invoke_claude("You summarize conversations between a financial analyst and an assistant.",
+                                  [{"role": "user", "content": prompt}],
+                                  max_tokens=400,
+                                  temperature=0)
+
+    def get_llm_response(self, prompt, system_instructs, past_responses : list =None, memory : conversationMemory =None):
+        """
+        Answers the prompt with a bounded history: recent turns verbatim and older ones as a summary.
+        The memory is kept on the chatbot between turns, past_responses is only loaded into it on the first turn
+        and the returned past_responses are the bounded verbatim turns, not the whole chat.
+        """
+        if memory is None:
+            if self.memory is None:
+                self.memory = conversationMemory(summarize=self.summarize_turns)
+                if past_responses:
+                    self.memory.load(past_responses)
+            memory = self.memory
+        messages = memory.build_messages(prompt)
+        try:
+            # Prepare message payload for Claude
+            answer = self.invoke_claude(memory.build_system(system_instructs), messages)
 
-            print(f"Previous answer: {prev_answer}")
-            print(f"Messages: {messages}")
+            print(f"Answered with {len(messages)} messages in history, summary of {len(memory.summary)} chars")
 
-            conversation_thread = messages + [prev_answer]
+            memory.add_turn(prompt, answer)
                         
             return {
-                'response': prev_answer['content'],
-                'past_responses': conversation_thread
+                'response': answer,
+                'past_responses': memory.messages(),
+                'memory': memory
             }
 
         except Exception as e:
             print(f"Error getting response: {str(e)}")
         
+def build_ticker_instructs(ticker, info: dict, max_workers=MAX_SEARCH_WORKERS, progress_callback=None):
+    """
+    Builds the system instructions of a ticker from its yfinance info.
+    progress_callback, if given, is called with a dict for each search completed and once the context is assembled.
+    """
+    obj = companyChatbot(
+        company_ticker=ticker,
+        company_name=info.get('longName', 'N/A'),
+        industry_name=info.get('sector', 'N/A'),
+        sub_sector_name=info.get('industry', 'N/A'),
+        country=info.get('country', 'N/A'),
+        company_description=info.get('longBusinessSummary', 'N/A'),
+        board_members=info.get('companyOfficers', []),
+        variables=None,
+        search_selection=None, # Auto select all search features
+        max_workers=max_workers,
+    )
+    obj.progress_callback = progress_callback
+    obj.build_instructions()
+    return obj.system_instructs
+
 if __name__ == "__main__":
     # Search selection (selection from selectbox)
     search_selection = {
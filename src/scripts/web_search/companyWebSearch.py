@@ -1,135 +1,289 @@
 from tavily import TavilyClient
-import os
-import boto3
-import json
+import concurrent.futures
+from .searchCache import get_search_cache
+from .sharedResults import get_shared_results
+from .contextBudget import budgetedContext
+from utils.credentials import get_secret as get_credential_secret
+from utils.fake_backends import use_fake_backends, FakeTavilyClient
+from utils.tracing import span, traced, current_span, submit_in_context
 
 def get_secret():
-
-    secret_name = "TAVILY_API_KEY_3"
-    region_name = "us-west-2"
-
-    # Create a Secrets Manager client
-    session = boto3.session.Session()
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=region_name
-    )
-
-    try:
-        get_secret_value_response = client.get_secret_value(
-            SecretId=secret_name
-        )
-    except Exception as e:
-        # For a list of exceptions thrown, see
-        # https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
-        raise e
-
-    secret = get_secret_value_response['SecretString']
-
-    secret = json.loads(secret)['TAVILY_API_KEY_3']
-
-    # Your code goes here.
-    return secret
-
-TAVILY_API_KEY = get_secret()
-# else:W
-#     TAVILY_API_KEY = os.environ['TAVILY_API_KEY']
+    """
+    Tavily API key, fetched from the process-wide credential provider the first time a search needs it.
+    """
+    return get_credential_secret("TAVILY_API_KEY_3", "TAVILY_API_KEY_3")
+
+# Default number of Tavily searches allowed in flight at once per company
+MAX_SEARCH_WORKERS = 8
+# Seconds to wait for the whole search fan-out before keeping partial results
+SEARCH_TIMEOUT = 30
+# Share of searches that may fail or time out before the results are rejected, e.g. on a bad API key or an outage
+MAX_FAILED_SEARCH_RATIO = 0.5
+
+# Search categories whose results only depend on the company itself
+COMPANY_SEARCH_KEYS = ['innovation',
+                       'quarterly_outlook',
+                       'bad_social_mentions',
+                       'good_social_mentions',
+                       'competitors']
+# Search categories shared across tickers, they only depend on the sector, industry or country
+SHARED_SEARCH_KEYS = ['industry',
+                      'sub_sector',
+                      'geolocation',
+                      'world_economy']
+
+# Default maximum size of the built context, in estimated tokens
+CONTEXT_TOKEN_BUDGET = 8000
+# Order in which context sections get the token budget, lowest first
+CONTEXT_PRIORITIES = {
+    'quarterly_outlook': 1,
+    'competitors': 2,
+    'innovation': 3,
+    'bad_social_mentions': 4,
+    'good_social_mentions': 4,
+    'industry': 5,
+    'sub_sector': 6,
+    'geolocation': 7,
+    'world_economy': 8,
+    'vars': 9,
+    'board_members': 10,
+}
 
 class companyWebSearch():
+    # Optional searchLimiter shared by every instance in the process, e.g. set by batch builds
+    search_limiter = None
 
-    def __init__(self):
+    def __init__(self, max_workers=MAX_SEARCH_WORKERS, search_timeout=SEARCH_TIMEOUT, search_cache=None, shared_results=None, progress_callback=None):
+        """
+        Parameters
+        ----------
+        max_workers : int
+            Maximum number of searches run concurrently. 1 runs them one after another.
+        search_timeout : float
+            Seconds to wait for all the searches to finish, searches still running after that are left empty.
+        search_cache : searchCache
+            Cache the answers are read from and written to, defaults to the process-wide on-disk cache.
+        shared_results : sharedSearchResults
+            Store of results shared across tickers, defaults to the process-wide store.
+        progress_callback : callable
+            Called with a dict describing each step of the search as it completes.
+        """
+        self.max_workers = max_workers
+        self.search_timeout = search_timeout
+        self.search_cache = search_cache if search_cache is not None else get_search_cache()
+        self.shared_results = shared_results if shared_results is not None else get_shared_results()
+        self.progress_callback = progress_callback
         self._set_client()
 
     def _set_client(self):
-        self.client = TavilyClient(api_key=TAVILY_API_KEY)
+        # The client is only created when a search misses the cache, so the API key is not fetched before it is needed
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = FakeTavilyClient() if use_fake_backends() else TavilyClient(api_key=get_secret())
+        return self._client
 
-    def search_context(self, query):
+    def search_context(self, query, category=None):
         """
         Can be used for building initial LLM context, or for getting search results real time for a given user query.
+        Answers are served from the shared search cache while they are fresher than the category's TTL.
         """
-        context = self.client.search(query, include_answer=True)
-        return context['answer'] # Return the summarized answer directly
+        with span('search.search_context', category=category, query_bytes=len(query)) as current:
+            answer = self.search_cache.get(query, category, include_answer=True)
+            current.set('cache_hit', answer is not None)
+            if answer is not None:
+                current.set('answer_bytes', len(answer))
+                return answer
+            if self.search_limiter is not None:
+                with self.search_limiter:
+                    context = self.client.search(query, include_answer=True)
+            else:
+                context = self.client.search(query, include_answer=True)
+            current.set('answer_bytes', len(context['answer'] or ""))
+            self.search_cache.set(query, context['answer'], category, include_answer=True)
+            return context['answer'] # Return the summarized answer directly
     
+    @traced('search.get_company_latest_innovation')
     def get_company_latest_innovation(self, company_name):
         """
         Get the latest innovation from a company.
         """
         query = "Latest innovation from " + company_name
-        context = self.search_context(query)
+        context = self.search_context(query, 'innovation')
         return context
     
+    @traced('search.get_company_quarterly_outlook')
     def get_company_quarterly_outlook(self, company_name):
         """
         Get the quarterly outlook of a company.
         """
         query = "Quarterly outlook of " + company_name + " Q3 Q4 2024"
-        context = self.search_context(query)
+        context = self.search_context(query, 'quarterly_outlook')
         return context
     
+    @traced('search.get_bad_media_press')
     def get_bad_media_press(self, company_name):
         """
         Get bad media press for a company.
         """
         query = "What is the latest bad news about google" + company_name + "?"
-        context = self.search_context(query)
+        context = self.search_context(query, 'bad_social_mentions')
         return context
     
+    @traced('search.get_good_media_press')
     def get_good_media_press(self, company_name):
         """
         Get good media press for a company.
         """
         query = "What is the latest good news about google " + company_name +"?"
-        context = self.search_context(query)
+        context = self.search_context(query, 'good_social_mentions')
         return context
     
+    @traced('search.get_company_competitors')
     def get_company_competitors(self, company_name):
         """
         Get competitors of a company.
         """
         query = "Main competitors of " + company_name
-        context = self.search_context(query)
+        context = self.search_context(query, 'competitors')
         return context
     
+    @traced('search.get_industry_info')
     def get_industry_info(self, industry_name):
         """
         Get industry information for a company.
         """
         query = "Current trends in the " + industry_name + " industry" + " Q3 Q4 2024"
-        context = self.search_context(query)
+        context = self.search_context(query, 'industry')
         return context
     
+    @traced('search.get_sub_sector_info')
     def get_sub_sector_info(self, sub_sector_name):
         """
         Get sub-sector information for a company.
         """
         query = "Current trends in the " + sub_sector_name + " sub-sector" + " Q3 Q4 2024"
-        context = self.search_context(query)
+        context = self.search_context(query, 'sub_sector')
         return context
     
+    @traced('search.get_geolocation_market_info')
     def get_geolocation_market_info(self, country):
         """
         Get geolocation information for a company.
         """
         query = "How is the market in " + country + " doing right now? Relevant statistics." + " Q3 Q4 2024"
-        context = self.search_context(query)
+        context = self.search_context(query, 'geolocation')
         return context
     
+    @traced('search.get_world_economy_info')
     def get_world_economy_info(self):
         """
         Get world economy information for a company.
         """
         query = "How is the world economy doing right now? Relevant statistics."  + " Q3 Q4 2024"
-        context = self.search_context(query)
+        context = self.search_context(query, 'world_economy')
         return context
 
+    @traced('search.get_board_member_info')
     def get_board_member_info(self, member_name, company_name):
         """
         Get information on a board member.
         """
         query = f"Who is {member_name} and how are they related to {company_name}? Is he invested in other sectors or company?"
-        context = self.search_context(query)
+        context = self.search_context(query, 'board_members')
         return context
 
+    def report_progress(self, stage, **details):
+        """
+        Sends a progress event to progress_callback if one is set, e.g. to show build progress in the UI.
+        """
+        if self.progress_callback is None:
+            return
+        try:
+            self.progress_callback({'stage': stage, **details})
+        except Exception as e:
+            print(f"Could not report progress: {str(e)}")
+
+    def _report_search_done(self, key, completed, total):
+        if isinstance(key, tuple):
+            self.report_progress('board_members', key=key[1], completed=completed, total=total)
+        else:
+            self.report_progress('search', key=key, completed=completed, total=total)
+
+    def run_searches(self, searches):
+        """
+        Runs the given searches, concurrently when max_workers > 1.
+        searches maps a result key to a (method, args) tuple. A search that fails or does not finish
+        within search_timeout is left as None so the other results can still be used.
+        """
+        results = {key: None for key in searches}
+        total = len(searches)
+        if self.max_workers <= 1:
+            for completed, (key, (method, args)) in enumerate(searches.items(), start=1):
+                try:
+                    results[key] = method(*args)
+                except Exception as e:
+                    print(f"Search {key} failed: {str(e)}")
+                self._report_search_done(key, completed, total)
+            return results
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = {submit_in_context(executor, method, *args): key for key, (method, args) in searches.items()}
+            completed = 0
+            try:
+                for future in concurrent.futures.as_completed(futures, timeout=self.search_timeout):
+                    key = futures[future]
+                    completed += 1
+                    try:
+                        results[key] = future.result()
+                    except Exception as e:
+                        print(f"Search {key} failed: {str(e)}")
+                    self._report_search_done(key, completed, total)
+            except concurrent.futures.TimeoutError:
+                for future, key in futures.items():
+                    if not future.done():
+                        print(f"Search {key} timed out after {self.search_timeout}s")
+        finally:
+            # Do not block on searches that timed out
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    def get_company_searches(self, company_name, necessary_keys, members):
+        """
+        Searches scoped to a single company, keyed by their place in the results.
+        """
+        searches = {
+            'innovation': (self.get_company_latest_innovation, (company_name,)),
+            'quarterly_outlook': (self.get_company_quarterly_outlook, (company_name,)),
+            'bad_social_mentions': (self.get_bad_media_press, (company_name,)),
+            'good_social_mentions': (self.get_good_media_press, (company_name,)),
+            'competitors': (self.get_company_competitors, (company_name,)),
+        }
+        searches = {key: search for key, search in searches.items() if necessary_keys[key]}
+        for member in members:
+            searches[('board_members', member['name'])] = (self.get_board_member_info, (member['name'], company_name))
+        return searches
+
+    def get_shared_searches(self, necessary_keys, industry_name, sub_sector_name, country):
+        """
+        Searches shared by every ticker with the same scope key (sector, industry, country, or the whole world).
+        They go through the shared results store so each is only run once per time window.
+        """
+        searches = {
+            'industry': (industry_name, self.get_industry_info, (industry_name,)),
+            'sub_sector': (sub_sector_name, self.get_sub_sector_info, (sub_sector_name,)),
+            'geolocation': (country, self.get_geolocation_market_info, (country,)),
+            'world_economy': ('global', self.get_world_economy_info, ()),
+        }
+        return {key: (self.get_shared_result, (key, scope_key, method, args))
+                for key, (scope_key, method, args) in searches.items() if necessary_keys[key]}
+
+    def get_shared_result(self, category, scope_key, method, args):
+        return self.shared_results.get_or_compute(category, scope_key, lambda: method(*args))
+
     def get_company_search_results(self, 
                                    company_name, 
                                    necessary_keys,
@@ -138,54 +292,37 @@ class companyWebSearch():
                                    country, members):
         """
         Performs multiple pre-defined searches to get a comprehensive overview of a company.
+        Raises a RuntimeError when most searches failed, so no context is built and stored from what is left.
         """
         if 'company_search_results' in self.__dict__:
             print("Returning cached search results")
             return self.company_search_results
         
-        # Get new company innovations
-        company_innovation = self.get_company_latest_innovation(company_name) if necessary_keys['innovation'] else None
-
-        # Get company quarterly outlook
-        company_financials = self.get_company_quarterly_outlook(company_name) if necessary_keys['quarterly_outlook'] else None
-
-        # Bad media press?
-        company_bad_social_mentions = self.get_bad_media_press(company_name) if necessary_keys['bad_social_mentions'] else None
-
-        # Good media press?
-        company_good_social_mentions = self.get_good_media_press(company_name) if necessary_keys['good_social_mentions'] else None
-
-        # Get company competitors
-        company_competitors = self.get_company_competitors(company_name) if necessary_keys['competitors'] else None
-
-        # Get industry information
-        industry_info = self.get_industry_info(industry_name) if necessary_keys['industry'] else None
-
-        # Get sub-sector information
-        sub_sector_info = self.get_sub_sector_info(sub_sector_name) if necessary_keys['sub_sector'] else None
-
-        # Get geolocation information
-        geolocation_info = self.get_geolocation_market_info(country) if necessary_keys['geolocation'] else None
+        searches = {
+            **self.get_company_searches(company_name, necessary_keys, members),
+            **self.get_shared_searches(necessary_keys, industry_name, sub_sector_name, country),
+        }
 
-        # Get world economy information
-        world_economy_info = self.get_world_economy_info() if necessary_keys['world_economy'] else None
+        results = self.run_searches(searches)
+        failed = [key for key, value in results.items() if value is None]
+        if searches and len(failed) > len(searches) * MAX_FAILED_SEARCH_RATIO:
+            raise RuntimeError(f"{len(failed)} of {len(searches)} searches failed for {company_name}")
 
         # Get board member information
         board_info = {}
         for member in members:
-            board_info[member['name']] = self.get_board_member_info(member['name'], company_name)
-            
+            board_info[member['name']] = results.get(('board_members', member['name']))
 
         self.company_search_results = {
-            'innovation': company_innovation,
-            'quarterly_outlook': company_financials,
-            'bad_social_mentions': company_bad_social_mentions,
-            'good_social_mentions': company_good_social_mentions,
-            'competitors': company_competitors,
-            'industry': industry_info,
-            'sub_sector': sub_sector_info,
-            'geolocation': geolocation_info,
-            'world_economy': world_economy_info,
+            'innovation': results.get('innovation'),
+            'quarterly_outlook': results.get('quarterly_outlook'),
+            'bad_social_mentions': results.get('bad_social_mentions'),
+            'good_social_mentions': results.get('good_social_mentions'),
+            'competitors': results.get('competitors'),
+            'industry': results.get('industry'),
+            'sub_sector': results.get('sub_sector'),
+            'geolocation': results.get('geolocation'),
+            'world_economy': results.get('world_economy'),
             'board_members': board_info
         }
         return self.company_search_results
@@ -200,7 +337,9 @@ class initialLLMContext(companyWebSearch):
                  company_description,
                  board_members,
                  vars: dict,
-                 search_selection: dict):
+                 search_selection: dict,
+                 max_workers=MAX_SEARCH_WORKERS,
+                 context_token_budget=CONTEXT_TOKEN_BUDGET):
         """
         Parameters
         ----------
@@ -214,24 +353,20 @@ class initialLLMContext(companyWebSearch):
             Dictionary containing various variables to add to the context of the LLM
         search_selection : dict
             Dictionary containing the search features to add, values are booleans
+        max_workers : int
+            Maximum number of web searches run concurrently
+        context_token_budget : int
+            Maximum size of the built context in estimated tokens, None for no limit
         """
 
         # Initialize the companyWebSearch class
         all_keys = list(search_selection.keys())
-        necessary_keys = ['innovation', 
-                          'quarterly_outlook', 
-                          'bad_social_mentions', 
-                          'good_social_mentions', 
-                          'competitors',
-                          'industry',
-                          'sub_sector',
-                          'geolocation',
-                          'world_economy']
+        necessary_keys = COMPANY_SEARCH_KEYS + SHARED_SEARCH_KEYS
         for key in necessary_keys:
             if key not in all_keys:
                 search_selection[key] = False
 
-        super().__init__()
+        super().__init__(max_workers=max_workers)
         self.company_ticker = company_ticker
         self.company_name = company_name
         self.company_description = company_description
@@ -241,35 +376,47 @@ class initialLLMContext(companyWebSearch):
         self.vars = vars
         self.search_selection = search_selection
         self.board_members = board_members
+        self.context_token_budget = context_token_budget
+        self.context_report = None
 
+    @traced('context.build_context')
     def build_context(self,
-                      search_results):
+                      search_results,
+                      token_budget=None):
         """
         Builds the context in Markdown format for the LLM.
+        Sections are cut by priority to fit in token_budget (defaults to context_token_budget),
+        the tokens each section contributed are left in self.context_report.
         """
-        context = f"""
+        context = budgetedContext(token_budget if token_budget is not None else self.context_token_budget)
+        context.add_section('header', f"""
         # ADDITIONAL CONTEXT:
         ## Company Ticker: {self.company_ticker}
         ## Company: {self.company_name}
         ## Description: {self.company_description}
-        """
+        """, priority=0)
 
         # Add in the selected search categories
         for key, value in search_results.items():
+            priority = CONTEXT_PRIORITIES.get(key, len(CONTEXT_PRIORITIES))
             if type(value) == dict:
-                context += f"### {key.capitalize()}\n"
-                for sub_key, sub_value in value.items():
-                    context += f"#### {sub_key.capitalize()}\n{sub_value}\n"
-            if value is not None:
-                context += f"### {key.capitalize()}\n{value}\n"
+                if value:
+                    lines = [f"### {key.capitalize()}\n"]
+                    lines += [f"#### {sub_key.capitalize()}\n{sub_value}\n" for sub_key, sub_value in value.items() if sub_value is not None]
+                    context.add_section(key, "".join(lines), priority)
+            elif value is not None:
+                context.add_section(key, f"### {key.capitalize()}\n{value}\n", priority)
 
         # Add in additional interesting vars if available
         if self.vars is not None:
-            context += "### Additional interesting variables"
-            for key, value in self.vars.items():
-                context += f"- {key}: {value}\n"
-
-        return context
+            lines = ["### Additional interesting variables\n"]
+            lines += [f"- {key}: {value}\n" for key, value in self.vars.items()]
+            context.add_section('vars', "".join(lines), CONTEXT_PRIORITIES['vars'])
+
+        built_context = context.build()
+        self.context_report = context.report()
+        current_span().set('tokens', self.context_report['total_tokens'])
+        return built_context
 
     def create_context(self):
         """
@@ -0,0 +1,85 @@
+import math
+
+# Average number of characters per token for English text
+CHARS_PER_TOKEN = 4
+# Sections that would be cut below this many tokens are dropped instead
+MIN_SECTION_TOKENS = 32
+TRUNCATION_MARKER = " [...]\n"
+
+def estimate_tokens(text):
+    """
+    Fast local estimate of the number of tokens in a text, no tokenizer needed.
+    """
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / CHARS_PER_TOKEN), len(text.split()))
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Cuts a text on a word boundary so its estimate, truncation marker included, is at most max_tokens.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARKER)
+    while max_chars > 0:
+        cut = text.rfind(" ", 0, max_chars)
+        truncated = text[:cut if cut > 0 else max_chars] + TRUNCATION_MARKER
+        tokens = estimate_tokens(truncated)
+        if tokens <= max_tokens:
+            return truncated
+        # Text made of short words has more tokens than characters suggest, shrink by the overshoot
+        max_chars = min(max_chars - 1, int(max_chars * max_tokens / tokens))
+    return ""
+
+class budgetedContext():
+    def __init__(self, token_budget=None):
+        """
+        Assembles context sections under a token budget.
+        Sections are kept in the order they were added, but the budget is handed out by priority
+        (lowest value first): the section that overflows is truncated and lower priority ones are dropped.
+
+        Parameters
+        ----------
+        token_budget : int
+            Maximum number of tokens in the built context, None for no limit.
+        """
+        self.token_budget = token_budget
+        self.sections = []
+        self.section_tokens = {}
+        self.truncated = []
+
+    def add_section(self, name, text, priority=0):
+        self.sections.append((name, text, priority))
+
+    def build(self):
+        """
+        Returns the context text and fills section_tokens with the tokens each section contributed.
+        """
+        included = {}
+        self.truncated = []
+        remaining = self.token_budget
+        for index in sorted(range(len(self.sections)), key=lambda i: self.sections[i][2]):
+            name, text, _ = self.sections[index]
+            tokens = estimate_tokens(text)
+            if remaining is None or tokens <= remaining:
+                included[index] = text
+            elif remaining >= MIN_SECTION_TOKENS:
+                included[index] = truncate_to_tokens(text, remaining)
+                self.truncated.append(name)
+            else:
+                continue
+            if remaining is not None:
+                remaining = max(remaining - estimate_tokens(included[index]), 0)
+
+        self.section_tokens = {name: estimate_tokens(included.get(index)) for index, (name, _, _) in enumerate(self.sections)}
+        return "".join(included[index] for index in range(len(self.sections)) if index in included)
+
+    def report(self):
+        """
+        Summary of the last build: tokens per section, sections cut or dropped, and the total.
+        """
+        return {
+            'token_budget': self.token_budget,
+            'total_tokens': sum(self.section_tokens.values()),
+            'section_tokens': self.section_tokens,
+            'truncated': self.truncated,
+            'dropped': [name for name, tokens in self.section_tokens.items() if tokens == 0],
+        }
@@ -0,0 +1,109 @@
+from utils.cache_utils import get_cache_dir
+import os
+import json
+import time
+
+# Bump when the format of the system instructions changes, older entries are then treated as stale
+CONTEXT_SCHEMA_VERSION = 1
+# Seconds a stored context is served without being refreshed
+CONTEXT_MAX_AGE = 24 * 3600
+
+class contextStore():
+    def __init__(self, path=None, s3_bucket=None, max_age=CONTEXT_MAX_AGE):
+        """
+        Versioned on-disk store of finished system instructions, one JSON file per ticker,
+        optionally mirrored to S3 so every server shares the same contexts.
+
+        Parameters
+        ----------
+        path : str
+            Directory the contexts are written to, defaults to the shared cache directory.
+        s3_bucket : str
+            Bucket the contexts are synced to, defaults to the CONTEXT_STORE_BUCKET environment variable.
+        max_age : float
+            Seconds a context stays fresh.
+        """
+        self.path = path if path is not None else get_cache_dir("contexts")
+        self.s3_bucket = s3_bucket if s3_bucket is not None else os.environ.get("CONTEXT_STORE_BUCKET")
+        self.max_age = max_age
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, ticker):
+        return os.path.join(self.path, f"{ticker.upper()}.json")
+
+    def _s3_key(self, ticker):
+        return f"contexts/{ticker.upper()}.json"
+
+    def _read(self, ticker):
+        try:
+            with open(self._file(ticker), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, ticker, system_instructs, metadata: dict = None):
+        """
+        Stores a new version of the system instructions of a ticker.
+        """
+        previous = self._read(ticker)
+        entry = {
+            'ticker': ticker.upper(),
+            'system_instructs': system_instructs,
+            'version': previous.get('version', 0) + 1 if previous is not None else 1,
+            'schema_version': CONTEXT_SCHEMA_VERSION,
+            'built_at': time.time(),
+            'metadata': metadata or {},
+        }
+        # Write to a temporary file first so readers never see a half written context
+        tmp_file = self._file(ticker) + f".{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_file, self._file(ticker))
+
+        if self.s3_bucket:
+            try:
+                from utils.s3_utils import upload_file_to_s3
+                upload_file_to_s3(self._file(ticker), self.s3_bucket, self._s3_key(ticker))
+            except Exception as e:
+                print(f"Could not sync context of {ticker} to S3: {str(e)}")
+        return entry
+
+    def get(self, ticker):
+        """
+        Returns the stored entry of a ticker, fetching it from S3 if it is not on disk yet.
+        Returns None if it was never built.
+        """
+        entry = self._read(ticker)
+        if entry is None and self.s3_bucket:
+            try:
+                from utils.s3_utils import download_file_from_s3
+                download_file_from_s3(self.s3_bucket, self._s3_key(ticker), self._file(ticker))
+                entry = self._read(ticker)
+            except Exception as e:
+                print(f"No context for {ticker} in S3: {str(e)}")
+        return entry
+
+    def is_compatible(self, entry):
+        """
+        Whether an entry was built with the current format, older ones must not be served at all.
+        """
+        return entry is not None and entry.get('schema_version') == CONTEXT_SCHEMA_VERSION
+
+    def is_fresh(self, entry, max_age=None):
+        """
+        Whether an entry can be served without refreshing it.
+        """
+        if not self.is_compatible(entry):
+            return False
+        max_age = max_age if max_age is not None else self.max_age
+        return time.time() - entry['built_at'] <= max_age
+
+    def get_fresh(self, ticker, max_age=None):
+        """
+        Returns the stored entry of a ticker only if it is fresh enough.
+        """
+        entry = self.get(ticker)
+        return entry if self.is_fresh(entry, max_age) else None
+
+    def tickers(self):
+        return sorted(name[:-len(".json")] for name in os.listdir(self.path) if name.endswith(".json"))
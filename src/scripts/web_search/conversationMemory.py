@@ -0,0 +1,105 @@
+from .contextBudget import estimate_tokens
+
+# Maximum estimated tokens of verbatim history sent with each turn
+MEMORY_TOKEN_CEILING = 2000
+# Number of most recent turns always kept verbatim
+MIN_RECENT_TURNS = 2
+# Characters kept per message when a turn is summarized without the LLM
+FALLBACK_SUMMARY_CHARS = 300
+
+class conversationMemory():
+    def __init__(self, token_ceiling=MEMORY_TOKEN_CEILING, min_recent_turns=MIN_RECENT_TURNS, summarize=None):
+        """
+        Chat history with a bounded size: recent turns are kept verbatim, older turns are folded
+        into a running summary once the verbatim history goes over token_ceiling.
+        The system instructions are never stored here, they are sent separately on each call.
+
+        Parameters
+        ----------
+        token_ceiling : int
+            Maximum estimated tokens of verbatim turns, the summary is capped to half of it.
+        min_recent_turns : int
+            Number of most recent turns never folded into the summary.
+        summarize : callable
+            summarize(summary, turns) returning the updated summary, or None to fall back to a plain excerpt.
+        """
+        self.token_ceiling = token_ceiling
+        self.min_recent_turns = min_recent_turns
+        self.summarize = summarize
+        self.turns = []
+        self.summary = ""
+
+    @staticmethod
+    def _turn_tokens(turn):
+        return sum(estimate_tokens(message['content']) for message in turn)
+
+    def load(self, messages: list):
+        """
+        Loads an existing list of user/assistant messages. A message without its counterpart,
+        e.g. a trailing question that was never answered, is left out.
+        """
+        index = 0
+        while index < len(messages) - 1:
+            if messages[index]['role'] == 'user' and messages[index + 1]['role'] == 'assistant':
+                self.turns.append([messages[index], messages[index + 1]])
+                index += 2
+            else:
+                index += 1
+        self.compact()
+
+    def add_turn(self, prompt, answer):
+        self.turns.append([{"role": "user", "content": prompt}, {"role": "assistant", "content": answer}])
+        self.compact()
+
+    def _fallback_summary(self, turns):
+        lines = [self.summary] if self.summary else []
+        for user_message, assistant_message in turns:
+            lines.append(f"- User asked: {user_message['content'][:FALLBACK_SUMMARY_CHARS]}")
+            lines.append(f"  Assistant answered: {assistant_message['content'][:FALLBACK_SUMMARY_CHARS]}")
+        lines = "\n".join(lines).split("\n")
+        # Keep the most recent lines if the summary grows too large, an answer is dropped along with its question
+        max_chars = self.token_ceiling * 2
+        size = sum(map(len, lines)) + len(lines) - 1
+        start = 0
+        while start < len(lines) - 1 and (size > max_chars or lines[start].startswith("  Assistant answered:")):
+            size -= len(lines[start]) + 1
+            start += 1
+        return "\n".join(lines[start:])
+
+    def compact(self):
+        """
+        Folds the oldest turns into the summary until the verbatim history fits the token ceiling.
+        """
+        old_turns = []
+        while len(self.turns) > self.min_recent_turns and sum(map(self._turn_tokens, self.turns)) > self.token_ceiling:
+            old_turns.append(self.turns.pop(0))
+        if not old_turns:
+            return
+
+        summary = None
+        if self.summarize is not None:
+            try:
+                summary = self.summarize(self.summary, old_turns)
+            except Exception as e:
+                print(f"Error summarizing conversation: {str(e)}")
+        self.summary = summary if summary else self._fallback_summary(old_turns)
+
+    def messages(self):
+        """
+        The recent verbatim turns as a flat list of messages.
+        """
+        return [message for turn in self.turns for message in turn]
+
+    def build_messages(self, prompt):
+        """
+        Messages to send for a new prompt: the recent verbatim turns followed by the prompt.
+        """
+        return self.messages() + [{"role": "user", "content": prompt}]
+
+    def build_system(self, system_instructs):
+        """
+        System prompt for a new turn, with the summary of the older turns appended.
+        """
+        if not self.summary:
+            return system_instructs
+        return f"{system_instructs}\n## SUMMARY OF THE CONVERSATION SO FAR:\n{self.summary}\n"
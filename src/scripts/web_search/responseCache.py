@@ -0,0 +1,144 @@
+from utils.aws_clients import get_client
+from utils.tracing import span
+import re
+import json
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+
+# Seconds a cached answer is served
+RESPONSE_CACHE_TTL = 6 * 3600
+# Least recently used answers are evicted past this many entries
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+# Minimum cosine similarity for a different wording of a question to reuse an answer
+SIMILARITY_THRESHOLD = 0.92
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v1"
+# Embeddings of missed questions kept until their answer is put, so a question is only embedded once
+MAX_PENDING_EMBEDDINGS = 256
+
+def bedrock_embed(text):
+    """
+    Embeds a question with Titan, used for similarity lookups.
+    """
+    body = json.dumps({"inputText": text})
+    with span('bedrock.invoke_model', model_id=EMBEDDING_MODEL_ID, request_bytes=len(body)) as current:
+        response = get_client('bedrock-runtime').invoke_model(
+            modelId=EMBEDDING_MODEL_ID,
+            body=body
+        )
+        raw = response['body'].read()
+        current.set('response_bytes', len(raw))
+    return json.loads(raw)['embedding']
+
+class responseCache():
+    def __init__(self,
+                 ttl=RESPONSE_CACHE_TTL,
+                 max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 similarity_threshold=SIMILARITY_THRESHOLD,
+                 embed=None):
+        """
+        Server-wide cache of agent answers keyed by (ticker, context version, normalized question).
+        When embed is given, a question worded differently reuses an answer whose question embedding
+        is at least similarity_threshold similar.
+
+        Parameters
+        ----------
+        ttl : float
+            Seconds an answer is served.
+        max_entries : int
+            Maximum number of answers kept, least recently used ones are evicted first.
+        similarity_threshold : float
+            Minimum cosine similarity for a similarity hit.
+        embed : callable
+            embed(text) returning an embedding vector, None for exact matches only.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._pending_embeddings = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_question(question):
+        question = re.sub(r"[^\w\s]", " ", question.lower())
+        return " ".join(question.split())
+
+    def _embed(self, question):
+        try:
+            vector = np.asarray(self.embed(question), dtype=np.float32)
+            return vector / (np.linalg.norm(vector) or 1.0)
+        except Exception as e:
+            print(f"Could not embed question: {str(e)}")
+            return None
+
+    def _expire(self, now):
+        for key in [key for key, entry in self._entries.items() if now - entry['created_at'] > self.ttl]:
+            self._entries.pop(key)
+
+    def get(self, ticker, context_version, question):
+        """
+        Returns a cached answer to the question, or None.
+        The question is only embedded when there is no exact match.
+        """
+        normalized = self.normalize_question(question)
+        key = (ticker, context_version, normalized)
+        with self._lock:
+            self._expire(time.time())
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry['answer']
+            candidates = [(key, entry) for key, entry in self._entries.items()
+                          if key[:2] == (ticker, context_version) and entry['embedding'] is not None]
+
+        if self.embed is not None and candidates:
+            vector = self._embed(normalized)
+            if vector is not None:
+                best_key, best_entry = max(candidates, key=lambda candidate: float(candidate[1]['embedding'] @ vector))
+                if float(best_entry['embedding'] @ vector) >= self.similarity_threshold:
+                    with self._lock:
+                        if best_key in self._entries:
+                            self._entries.move_to_end(best_key)
+                        self.similar_hits += 1
+                    return best_entry['answer']
+                with self._lock:
+                    self._pending_embeddings[normalized] = vector
+                    while len(self._pending_embeddings) > MAX_PENDING_EMBEDDINGS:
+                        self._pending_embeddings.popitem(last=False)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, ticker, context_version, question, answer):
+        normalized = self.normalize_question(question)
+        # Reuse the embedding computed when the question missed the cache
+        with self._lock:
+            embedding = self._pending_embeddings.pop(normalized, None)
+        if embedding is None and self.embed is not None:
+            embedding = self._embed(normalized)
+        with self._lock:
+            self._entries[(ticker, context_version, normalized)] = {
+                'answer': answer,
+                'embedding': embedding,
+                'created_at': time.time(),
+            }
+            self._entries.move_to_end((ticker, context_version, normalized))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+            }
@@ -0,0 +1,183 @@
+from utils.cache_utils import get_cache_dir, connect_sqlite
+import os
+import json
+import time
+import hashlib
+import threading
+
+# Seconds a cached search answer stays valid, per search category
+DEFAULT_TTLS = {
+    'innovation': 6 * 3600,
+    'quarterly_outlook': 12 * 3600,
+    'bad_social_mentions': 3 * 3600,
+    'good_social_mentions': 3 * 3600,
+    'competitors': 7 * 24 * 3600,
+    'industry': 24 * 3600,
+    'sub_sector': 24 * 3600,
+    'geolocation': 12 * 3600,
+    'world_economy': 12 * 3600,
+    'board_members': 7 * 24 * 3600,
+}
+DEFAULT_TTL = 3600
+# Least recently used entries are evicted past this many answers
+MAX_ENTRIES = 5000
+# Seconds a hit may leave last_access behind before it is written, so most hits are read-only
+LAST_ACCESS_RESOLUTION = 300
+
+class searchCache():
+    def __init__(self, path=None, ttls: dict = None, max_entries=MAX_ENTRIES):
+        """
+        On-disk cache of search answers shared by every process on the machine.
+
+        Parameters
+        ----------
+        path : str
+            Location of the SQLite file, defaults to the shared cache directory.
+        ttls : dict
+            Seconds an answer stays valid per category, merged over DEFAULT_TTLS.
+        max_entries : int
+            Maximum number of answers kept, least recently used ones are evicted first.
+        """
+        self.path = path if path is not None else os.path.join(get_cache_dir("search"), "search_cache.sqlite")
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # Shared counter increments not written yet, added on the next write to the cache file
+        self._pending_counts = {}
+        self._lock = threading.Lock()
+        self._create_tables()
+
+    def _connect(self):
+        return connect_sqlite(self.path)
+
+    def _create_tables(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    category TEXT,
+                    query TEXT,
+                    value TEXT,
+                    created_at REAL,
+                    expires_at REAL,
+                    last_access REAL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, count INTEGER)")
+
+    @staticmethod
+    def normalize_query(query):
+        return " ".join(query.lower().split())
+
+    def make_key(self, query, **params):
+        """
+        Key on the normalized query plus any search parameters that change the answer.
+        """
+        raw = json.dumps({'query': self.normalize_query(query), 'params': params}, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get_ttl(self, category):
+        return self.ttls.get(category, DEFAULT_TTL)
+
+    def _count(self, name):
+        with self._lock:
+            self._pending_counts[name] = self._pending_counts.get(name, 0) + 1
+
+    def _flush_counts(self, conn):
+        with self._lock:
+            pending, self._pending_counts = self._pending_counts, {}
+        for name, count in pending.items():
+            conn.execute("INSERT INTO counters (name, count) VALUES (?, ?) "
+                         "ON CONFLICT(name) DO UPDATE SET count = count + excluded.count", (name, count))
+
+    def get(self, query, category=None, **params):
+        """
+        Returns the cached answer for the query, or None if it is missing or expired.
+        Hits only write to the cache file when last_access is more than LAST_ACCESS_RESOLUTION behind,
+        so concurrent readers do not queue on SQLite's writer lock.
+        """
+        key = self.make_key(query, **params)
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute("SELECT value, expires_at, last_access FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < now:
+            self._count('misses')
+            with conn:
+                if row is not None:
+                    conn.execute("DELETE FROM entries WHERE key = ? AND expires_at < ?", (key, now))
+                self._flush_counts(conn)
+            with self._lock:
+                self.misses += 1
+            return None
+        self._count('hits')
+        if now - row[2] > LAST_ACCESS_RESOLUTION:
+            with conn:
+                conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+                self._flush_counts(conn)
+        with self._lock:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, query, value, category=None, ttl=None, **params):
+        """
+        Stores an answer for the query, evicting the least recently used answers if the cache is full.
+        """
+        if value is None:
+            return
+        key = self.make_key(query, **params)
+        now = time.time()
+        ttl = ttl if ttl is not None else self.get_ttl(category)
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO entries (key, category, query, value, created_at, expires_at, last_access) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (key, category, query, json.dumps(value), now, now + ttl, now))
+            conn.execute("DELETE FROM entries WHERE expires_at < ?", (now,))
+            self._flush_counts(conn)
+            overflow = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute("DELETE FROM entries WHERE key IN "
+                             "(SELECT key FROM entries ORDER BY last_access LIMIT ?)", (overflow,))
+                conn.execute("INSERT INTO counters (name, count) VALUES ('evictions', ?) "
+                             "ON CONFLICT(name) DO UPDATE SET count = count + excluded.count", (overflow,))
+
+    def stats(self):
+        """
+        Hit/miss counters for this process and across all processes using the same file.
+        """
+        conn = self._connect()
+        with conn:
+            self._flush_counts(conn)
+        shared = dict(conn.execute("SELECT name, count FROM counters").fetchall())
+        size = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'shared_hits': shared.get('hits', 0),
+            'shared_misses': shared.get('misses', 0),
+            'evictions': shared.get('evictions', 0),
+            'entries': size,
+        }
+
+    def clear(self):
+        conn = self._connect()
+        with self._lock:
+            self._pending_counts = {}
+        with conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM counters")
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+def get_search_cache():
+    """
+    Process-wide search cache, created on first use.
+    """
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None:
+            _search_cache = searchCache()
+        return _search_cache
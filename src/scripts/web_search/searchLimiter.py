@@ -0,0 +1,40 @@
+import time
+import threading
+
+class searchLimiter():
+    def __init__(self, max_concurrent=8, requests_per_second=None):
+        """
+        Caps the number of search API calls in flight and, optionally, their rate.
+        Used as a context manager around each call.
+
+        Parameters
+        ----------
+        max_concurrent : int
+            Maximum number of calls in flight at once across all threads.
+        requests_per_second : float
+            Maximum sustained call rate, None for no rate limit.
+        """
+        self.max_concurrent = max_concurrent
+        self.requests_per_second = requests_per_second
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def _wait_for_slot(self):
+        # Calls are spaced 1 / requests_per_second apart, reserving slots in order
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.requests_per_second
+        if slot > now:
+            time.sleep(slot - now)
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        if self.requests_per_second:
+            self._wait_for_slot()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._semaphore.release()
+        return False
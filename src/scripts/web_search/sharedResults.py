@@ -0,0 +1,97 @@
+from .searchCache import get_search_cache
+import time
+import threading
+import concurrent.futures
+
+# Seconds a shared result is reused for before being searched again
+SHARED_RESULTS_WINDOW = 6 * 3600
+
+class sharedSearchResults():
+    def __init__(self, window=SHARED_RESULTS_WINDOW, search_cache=None):
+        """
+        Results of searches that do not depend on the company, shared by every ticker.
+        Each result is computed once per (category, scope key, time window): concurrent requests
+        for the same result wait on the first one, and results are persisted to the search cache
+        so other processes reuse them too.
+
+        Parameters
+        ----------
+        window : float
+            Length in seconds of the time window a result is reused for.
+        search_cache : searchCache
+            Cache used to share results across processes, defaults to the process-wide cache.
+        """
+        self.window = window
+        self.search_cache = search_cache if search_cache is not None else get_search_cache()
+        self.computed = 0
+        self.reused = 0
+        self._results = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, category, scope_key, compute):
+        """
+        Returns the shared result for (category, scope_key) in the current time window,
+        calling compute() only if no process has produced it yet.
+        """
+        window_index = int(time.time() // self.window)
+        key = (category, scope_key, window_index)
+        with self._lock:
+            if key in self._results:
+                self.reused += 1
+                return self._results[key]
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = concurrent.futures.Future()
+                self._in_flight[key] = future
+        if not owner:
+            with self._lock:
+                self.reused += 1
+            return future.result()
+
+        cache_query = f"shared::{category}::{scope_key}::{window_index}"
+        try:
+            value = self.search_cache.get(cache_query, category)
+            if value is None:
+                value = compute()
+                self.search_cache.set(cache_query, value, category, ttl=self.window)
+                with self._lock:
+                    self.computed += 1
+            else:
+                with self._lock:
+                    self.reused += 1
+        except Exception as e:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            # Drop results from earlier windows, they will never be served again
+            self._results = {k: v for k, v in self._results.items() if k[2] == window_index}
+            if value is not None:
+                self._results[key] = value
+            self._in_flight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def clear(self):
+        """
+        Forgets the results held in memory, the ones persisted to the search cache are kept.
+        """
+        with self._lock:
+            self._results = {}
+
+_shared_results = None
+_shared_results_lock = threading.Lock()
+
+def get_shared_results():
+    """
+    Process-wide store of shared search results, created on first use.
+    """
+    global _shared_results
+    with _shared_results_lock:
+        if _shared_results is None:
+            _shared_results = sharedSearchResults()
+        return _shared_results
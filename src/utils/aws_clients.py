@@ -0,0 +1,96 @@
+import boto3
+import threading
+from utils.fake_backends import use_fake_backends, FAKE_AWS_CLIENTS
+from botocore.config import Config
+
+# Connections kept open per client, enough for the concurrent searches, embeddings and chats of one server
+MAX_POOL_CONNECTIONS = 50
+# Settings every client is created with, callers can override any of them
+DEFAULT_CLIENT_CONFIG = {
+    'max_pool_connections': MAX_POOL_CONNECTIONS,
+    'tcp_keepalive': True,
+    'connect_timeout': 5,
+    'read_timeout': 120,
+    'retries': {'max_attempts': 5, 'mode': 'adaptive'},
+}
+
+_session = None
+_clients = {}
+_lock = threading.Lock()
+_stats = {'creations': 0, 'cache_hits': 0}
+
+def get_session():
+    """
+    Process-wide boto3 session, created on first use.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.Session()
+        return _session
+
+def get_client(service_name, region_name=None, **config):
+    """
+    Returns a pooled boto3 client, created once per process for each (service, region, config).
+    Clients are thread-safe and keep their connections alive, so they are reused across
+    Streamlit reruns, sessions and threads.
+    With fake backends selected, Bedrock services get the local stand-ins instead.
+    """
+    key = (service_name, region_name, repr(sorted(config.items())))
+    session = get_session()
+    with _lock:
+        client = _clients.get(key)
+        if client is not None:
+            _stats['cache_hits'] += 1
+            return client
+        if use_fake_backends() and service_name in FAKE_AWS_CLIENTS:
+            client = FAKE_AWS_CLIENTS[service_name]()
+            _clients[key] = client
+            _stats['creations'] += 1
+            return client
+        client_config = Config(**{**DEFAULT_CLIENT_CONFIG, **config})
+        # boto3 sessions are not thread-safe, so clients are created under the lock
+        client = session.client(service_name, region_name=region_name, config=client_config)
+        _clients[key] = client
+        _stats['creations'] += 1
+        return client
+
+def _connection_pools(client):
+    # urllib3 pools behind a botocore client, the fake clients have none
+    http_session = getattr(getattr(client, '_endpoint', None), 'http_session', None)
+    managers = [getattr(http_session, '_manager', None), *getattr(http_session, '_proxy_managers', {}).values()]
+    for manager in managers:
+        if manager is None:
+            continue
+        pools = manager.pools
+        for pool_key in list(pools.keys()):
+            pool = pools.get(pool_key)
+            if pool is not None:
+                yield pool
+
+def get_connection_stats():
+    """
+    HTTP connections opened and requests sent by the pools of the cached clients, from urllib3's own counters.
+    Requests beyond the connections opened went over a kept-alive connection. Pools dropped by urllib3
+    take their counts with them.
+    """
+    with _lock:
+        clients = list(_clients.values())
+    stats = {'pools': 0, 'connections_opened': 0, 'requests': 0}
+    for client in clients:
+        for pool in _connection_pools(client):
+            stats['pools'] += 1
+            stats['connections_opened'] += pool.num_connections
+            stats['requests'] += pool.num_requests
+    stats['connections_reused'] = max(stats['requests'] - stats['connections_opened'], 0)
+    return stats
+
+def get_client_stats():
+    """
+    Number of clients created and of lookups served from the client cache,
+    along with the connection reuse of their HTTP pools.
+    """
+    with _lock:
+        stats = {**_stats, 'clients': len(_clients)}
+    stats['connections'] = get_connection_stats()
+    return stats
@@ -0,0 +1,31 @@
+import os
+import sqlite3
+import threading
+
+# Root directory for everything the app caches on disk, can be overridden with DATATHON_CACHE_DIR
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "datathon")
+
+def get_cache_dir(*parts):
+    """
+    Returns (and creates) a directory under the shared on-disk cache root.
+    """
+    path = os.path.join(os.environ.get("DATATHON_CACHE_DIR", DEFAULT_CACHE_DIR), *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+_sqlite_local = threading.local()
+
+def connect_sqlite(path):
+    """
+    Returns this thread's connection to a SQLite cache file, opened in WAL mode on first use.
+    """
+    # sqlite connections can't be shared across threads or forked processes
+    if getattr(_sqlite_local, 'pid', None) != os.getpid():
+        _sqlite_local.conns = {}
+        _sqlite_local.pid = os.getpid()
+    conn = _sqlite_local.conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        _sqlite_local.conns[path] = conn
+    return conn
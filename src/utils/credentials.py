@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import threading
+
+# Seconds a fetched secret is reused before it is fetched again
+SECRET_REFRESH_INTERVAL = 3600
+
+class CredentialProvider:
+    """
+    Base class for the sources secrets can be read from.
+    """
+    def get_secret(self, name, field=None):
+        raise NotImplementedError
+
+class SecretsManagerProvider(CredentialProvider):
+    def __init__(self, region_name="us-west-2", refresh_interval=SECRET_REFRESH_INTERVAL):
+        """
+        Reads secrets from AWS Secrets Manager on first use and memoizes them for refresh_interval seconds.
+        """
+        self.region_name = region_name
+        self.refresh_interval = refresh_interval
+        self._secrets = {}
+        self._lock = threading.Lock()
+
+    def _fetch(self, name):
+        import boto3 # Imported here so importing this module stays cheap
+
+        session = boto3.session.Session()
+        client = session.client(
+            service_name='secretsmanager',
+            region_name=self.region_name
+        )
+        return client.get_secret_value(SecretId=name)['SecretString']
+
+    def get_secret(self, name, field=None):
+        with self._lock:
+            secret, fetched_at = self._secrets.get(name, (None, 0))
+            if secret is None or time.time() - fetched_at > self.refresh_interval:
+                secret = self._fetch(name)
+                self._secrets[name] = (secret, time.time())
+        if field is not None:
+            return json.loads(secret)[field]
+        return secret
+
+class EnvCredentialProvider(CredentialProvider):
+    """
+    Reads secrets from environment variables, named after the field if given, otherwise after the secret.
+    """
+    def get_secret(self, name, field=None):
+        key = field if field is not None else name
+        if key not in os.environ:
+            raise KeyError(f"Environment variable {key} is not set")
+        return os.environ[key]
+
+class FileCredentialProvider(CredentialProvider):
+    def __init__(self, path):
+        """
+        Reads secrets from a local JSON file mapping secret names to either a value or a dict of fields.
+        """
+        self.path = path
+
+    def get_secret(self, name, field=None):
+        with open(self.path) as f:
+            secret = json.load(f)[name]
+        if field is not None:
+            return secret[field] if isinstance(secret, dict) else json.loads(secret)[field]
+        return secret
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_credential_provider():
+    """
+    Process-wide credential provider, chosen with the CREDENTIAL_PROVIDER environment variable
+    (secretsmanager, env or file) the first time a secret is needed.
+    """
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            kind = os.environ.get("CREDENTIAL_PROVIDER", "secretsmanager").lower()
+            if kind == "env":
+                _provider = EnvCredentialProvider()
+            elif kind == "file":
+                _provider = FileCredentialProvider(os.environ.get("CREDENTIALS_FILE", "credentials.json"))
+            elif kind == "secretsmanager":
+                _provider = SecretsManagerProvider()
+            else:
+                raise ValueError(f"Unknown credential provider {kind}")
+        return _provider
+
+def set_credential_provider(provider: CredentialProvider):
+    """
+    Replaces the process-wide credential provider, e.g. with a local one for offline runs.
+    """
+    global _provider
+    with _provider_lock:
+        _provider = provider
+
+def get_secret(name, field=None):
+    return get_credential_provider().get_secret(name, field)
@@ -0,0 +1,325 @@
+"""
+Local stand-ins for Tavily, Bedrock and yfinance, so the app can be run, load-tested and benchmarked
+without network access. Selected with DATATHON_BACKEND=fake, and tuned with:
+
+- FAKE_LATENCY_MS / FAKE_LATENCY_JITTER_MS / FAKE_LATENCY_DISTRIBUTION (fixed, uniform, normal or lognormal)
+- FAKE_ERROR_RATE, the probability each call fails
+- FAKE_CHUNK_LATENCY_MS, the delay between streamed agent chunks
+- FAKE_RECORDINGS, a JSON file of recorded answers: {"search": {query: answer}, "agent": {prompt: answer}}
+"""
+import io
+import os
+import json
+import math
+import time
+import zlib
+import random
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+EMBEDDING_DIMENSIONS = 1536
+# Words in a synthetic search answer and a synthetic agent answer
+SEARCH_ANSWER_WORDS = 120
+AGENT_ANSWER_WORDS = 250
+# Words per streamed agent chunk
+CHUNK_WORDS = 5
+FILLER = ("revenue margin growth guidance outlook demand supply pricing market share competition regulation "
+          "earnings cash flow investment innovation product segment quarter consensus analyst valuation").split()
+
+def use_fake_backends():
+    return os.environ.get("DATATHON_BACKEND", "live").lower() == "fake"
+
+class FakeBackendError(Exception):
+    pass
+
+class FakeThrottlingError(FakeBackendError):
+    """
+    Shaped like a botocore ClientError so throttling handling can be exercised offline.
+    """
+    def __init__(self, operation):
+        super().__init__(f"An error occurred (ThrottlingException) when calling the {operation} operation: Rate exceeded")
+        self.response = {'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}
+
+class LatencyModel:
+    def __init__(self, mean_ms=None, jitter_ms=None, distribution=None, error_rate=None):
+        """
+        Delay and failure injection shared by the fake clients, defaults come from the environment.
+        """
+        self.mean_ms = float(mean_ms if mean_ms is not None else os.environ.get("FAKE_LATENCY_MS", 200))
+        self.jitter_ms = float(jitter_ms if jitter_ms is not None else os.environ.get("FAKE_LATENCY_JITTER_MS", 50))
+        self.distribution = distribution or os.environ.get("FAKE_LATENCY_DISTRIBUTION", "lognormal")
+        self.error_rate = float(error_rate if error_rate is not None else os.environ.get("FAKE_ERROR_RATE", 0))
+
+    def sample_ms(self):
+        if self.distribution == "fixed" or self.mean_ms <= 0:
+            return max(self.mean_ms, 0)
+        if self.distribution == "uniform":
+            return random.uniform(max(self.mean_ms - self.jitter_ms, 0), self.mean_ms + self.jitter_ms)
+        if self.distribution == "normal":
+            return max(random.gauss(self.mean_ms, self.jitter_ms), 0)
+        # Lognormal with the requested mean and standard deviation, gives the long tail of real APIs
+        sigma2 = math.log(1 + (self.jitter_ms / self.mean_ms) ** 2)
+        return random.lognormvariate(math.log(self.mean_ms) - sigma2 / 2, math.sqrt(sigma2))
+
+    def wait(self):
+        time.sleep(self.sample_ms() / 1000)
+
+    def should_fail(self):
+        return random.random() < self.error_rate
+
+class BackendStats:
+    """
+    Calls, errors and bytes exchanged per fake backend, e.g. for benchmarks.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+
+    def record(self, backend, bytes_in=0, bytes_out=0, error=False):
+        with self._lock:
+            counter = self.counters.setdefault(backend, {'calls': 0, 'errors': 0, 'bytes_in': 0, 'bytes_out': 0})
+            counter['calls'] += 1
+            counter['errors'] += int(error)
+            counter['bytes_in'] += bytes_in
+            counter['bytes_out'] += bytes_out
+
+    def snapshot(self):
+        with self._lock:
+            return {backend: dict(counter) for backend, counter in self.counters.items()}
+
+BACKEND_STATS = BackendStats()
+_recordings = None
+
+def get_recordings():
+    global _recordings
+    if _recordings is None:
+        path = os.environ.get("FAKE_RECORDINGS")
+        _recordings = {}
+        if path:
+            with open(path) as f:
+                _recordings = json.load(f)
+    return _recordings
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+def synthetic_text(seed_text, words):
+    # Deterministic per input so repeated runs produce the same payload sizes
+    rng = random.Random(zlib.crc32(seed_text.encode('utf-8')))
+    return " ".join(rng.choice(FILLER) for _ in range(words)) + "."
+
+def _recorded(kind, key):
+    return get_recordings().get(kind, {}).get(_normalize(key))
+
+class FakeTavilyClient:
+    def __init__(self, latency: LatencyModel = None):
+        self.latency = latency or LatencyModel()
+
+    def search(self, query, **kwargs):
+        self.latency.wait()
+        if self.latency.should_fail():
+            BACKEND_STATS.record('tavily', bytes_out=len(query), error=True)
+            raise FakeBackendError(f"Fake Tavily search failed for {query}")
+        answer = _recorded('search', query) or f"Synthetic answer for '{query}': " + synthetic_text(query, SEARCH_ANSWER_WORDS)
+        BACKEND_STATS.record('tavily', bytes_out=len(query), bytes_in=len(answer))
+        return {'query': query, 'answer': answer, 'results': []}
+
+def fake_embedding(text):
+    """
+    Deterministic unit vector for a text, identical texts get identical embeddings.
+    """
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSIONS).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+class FakeBedrockRuntimeClient:
+    def __init__(self, latency: LatencyModel = None):
+        self.latency = latency or LatencyModel()
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self.latency.wait()
+        if self.latency.should_fail():
+            BACKEND_STATS.record('bedrock-runtime', bytes_out=len(body), error=True)
+            raise FakeThrottlingError("InvokeModel")
+        request = json.loads(body)
+        if 'embed' in modelId:
+            payload = {'embedding': fake_embedding(request['inputText']), 'inputTextTokenCount': len(request['inputText'].split())}
+        elif modelId.startswith('anthropic'):
+            prompt = request['messages'][-1]['content']
+            text = _recorded('agent', prompt) or synthetic_text(prompt, AGENT_ANSWER_WORDS)
+            payload = {'role': 'assistant', 'content': [{'type': 'text', 'text': text}]}
+        else:
+            prompt = request.get('inputText', '')
+            text = _recorded('agent', prompt) or synthetic_text(prompt, AGENT_ANSWER_WORDS)
+            payload = {'results': [{'outputText': text, 'tokenCount': len(text.split())}]}
+        response = json.dumps(payload).encode('utf-8')
+        BACKEND_STATS.record('bedrock-runtime', bytes_out=len(body), bytes_in=len(response))
+        return {'body': io.BytesIO(response), 'contentType': 'application/json'}
+
+class FakeBedrockAgentRuntimeClient:
+    def __init__(self, latency: LatencyModel = None, chunk_latency: LatencyModel = None):
+        self.latency = latency or LatencyModel()
+        chunk_ms = float(os.environ.get("FAKE_CHUNK_LATENCY_MS", 20))
+        self.chunk_latency = chunk_latency or LatencyModel(mean_ms=chunk_ms, jitter_ms=chunk_ms / 4, error_rate=0)
+
+    def _stream(self, text):
+        words = text.split(" ")
+        for index in range(0, len(words), CHUNK_WORDS):
+            self.chunk_latency.wait()
+            chunk = " ".join(words[index:index + CHUNK_WORDS]) + (" " if index + CHUNK_WORDS < len(words) else "")
+            data = chunk.encode('utf-8')
+            BACKEND_STATS.record('bedrock-agent-chunk', bytes_in=len(data))
+            yield {'chunk': {'bytes': data}}
+
+    def invoke_agent(self, agentId, agentAliasId, inputText, sessionId, **kwargs):
+        # The latency here is the time to the first event, later chunks follow chunk_latency
+        self.latency.wait()
+        if self.latency.should_fail():
+            BACKEND_STATS.record('bedrock-agent-runtime', bytes_out=len(inputText), error=True)
+            raise FakeThrottlingError("InvokeAgent")
+        text = _recorded('agent', inputText) or synthetic_text(inputText, AGENT_ANSWER_WORDS)
+        BACKEND_STATS.record('bedrock-agent-runtime', bytes_out=len(inputText))
+        return {'completion': self._stream(text), 'sessionId': sessionId, 'contentType': 'application/json'}
+
+FAKE_AWS_CLIENTS = {
+    'bedrock-runtime': FakeBedrockRuntimeClient,
+    'bedrock-agent-runtime': FakeBedrockAgentRuntimeClient,
+}
+
+class FakeYFTicker:
+    def __init__(self, ticker, latency: LatencyModel = None):
+        self.ticker = ticker.upper()
+        self.latency = latency or LatencyModel()
+        self._seed = zlib.crc32(self.ticker.encode('utf-8'))
+
+    def _call(self, dataset):
+        self.latency.wait()
+        if self.latency.should_fail():
+            BACKEND_STATS.record('yfinance', error=True)
+            raise FakeBackendError(f"Fake yfinance {dataset} failed for {self.ticker}")
+        BACKEND_STATS.record('yfinance')
+
+    @property
+    def info(self):
+        self._call('info')
+        rng = random.Random(self._seed)
+        price = round(rng.uniform(10, 500), 2)
+        return {
+            'symbol': self.ticker,
+            'longName': f"{self.ticker} Holdings Inc.",
+            'quoteType': 'EQUITY',
+            'sector': rng.choice(['Technology', 'Healthcare', 'Financial Services', 'Energy']),
+            'industry': rng.choice(['Software - Infrastructure', 'Semiconductors', 'Biotechnology', 'Banks - Diversified']),
+            'industryKey': 'fake-industry',
+            'country': rng.choice(['United States', 'Canada', 'Germany']),
+            'website': f"https://www.{self.ticker.lower()}.example.com",
+            'longBusinessSummary': synthetic_text(self.ticker, 80),
+            'currentPrice': price,
+            'marketCap': int(price * rng.uniform(1e8, 1e10)),
+            'fiftyTwoWeekHigh': round(price * 1.2, 2),
+            'fiftyTwoWeekLow': round(price * 0.7, 2),
+            'trailingPE': round(rng.uniform(8, 60), 1),
+            'companyOfficers': [
+                {'name': f"Officer {index} {self.ticker}", 'title': 'Director', 'yearBorn': 1960 + index,
+                 'age': 64 - index, 'fiscalYear': 2023, 'totalPay': rng.randint(10**5, 10**7)}
+                for index in range(rng.randint(3, 10))
+            ],
+        }
+
+    def history(self, period='1y', start=None, **kwargs):
+        self._call('history')
+        end = pd.Timestamp.now().normalize()
+        if start is not None:
+            begin = pd.Timestamp(start)
+        elif period == 'max':
+            begin = end - pd.DateOffset(years=20)
+        elif period == 'ytd':
+            begin = pd.Timestamp(year=end.year, month=1, day=1)
+        else:
+            count = int(period.rstrip('dmoy'))
+            unit = period[len(str(count)):]
+            begin = end - {'d': pd.DateOffset(days=count), 'mo': pd.DateOffset(months=count), 'y': pd.DateOffset(years=count)}[unit]
+        # The random walk is seeded by ticker and date so overlapping downloads agree
+        dates = pd.bdate_range(begin, end, name='Date')
+        rng = np.random.default_rng(self._seed)
+        all_dates = pd.bdate_range(end - pd.DateOffset(years=20), end)
+        closes = pd.Series(100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(all_dates)))), index=all_dates).reindex(dates)
+        return pd.DataFrame({
+            'Open': closes * 0.995,
+            'High': closes * 1.01,
+            'Low': closes * 0.99,
+            'Close': closes,
+            'Volume': (rng.integers(10**5, 10**7, len(dates))),
+            'Dividends': 0.0,
+            'Stock Splits': 0.0,
+        }, index=dates)
+
+    @property
+    def recommendations(self):
+        self._call('recommendations')
+        rng = random.Random(self._seed)
+        return pd.DataFrame([{'period': '0m', 'strongBuy': rng.randint(0, 10), 'buy': rng.randint(0, 20),
+                              'hold': rng.randint(0, 15), 'sell': rng.randint(0, 5), 'strongSell': rng.randint(0, 3)}])
+
+    @property
+    def income_stmt(self):
+        self._call('income_stmt')
+        rng = random.Random(self._seed)
+        years = [pd.Timestamp(year=pd.Timestamp.now().year - offset, month=12, day=31) for offset in range(1, 5)]
+        return pd.DataFrame({year: {'Total Revenue': rng.uniform(1e9, 1e11), 'Net Income': rng.uniform(1e8, 1e10)} for year in years})
+
+    @property
+    def dividends(self):
+        self._call('dividends')
+        return pd.Series(dtype=float, name='Dividends')
+
+def fake_download(tickers, group_by='ticker', **kwargs):
+    """
+    Stand-in for yf.download returning columns grouped by ticker.
+    """
+    tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+    frames = {ticker: FakeYFTicker(ticker).history(period=kwargs.get('period', '1y'), start=kwargs.get('start')) for ticker in tickers}
+    return pd.concat(frames, axis=1)
+
+class FakeYFIndustry:
+    def __init__(self, industry_key):
+        self.industry_key = industry_key
+
+    @property
+    def top_companies(self):
+        rng = random.Random(zlib.crc32(self.industry_key.encode('utf-8')))
+        symbols = ["".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(4)) for _ in range(10)]
+        return pd.DataFrame({'name': [f"{symbol} Holdings Inc." for symbol in symbols]}, index=pd.Index(symbols, name='symbol'))
+
+def get_yf_ticker(ticker):
+    """
+    yf.Ticker, or its fake when fake backends are selected.
+    """
+    if use_fake_backends():
+        return FakeYFTicker(ticker)
+    import yfinance as yf
+    return yf.Ticker(ticker)
+
+def yf_download(tickers, **kwargs):
+    """
+    yf.download, or its fake when fake backends are selected.
+    """
+    if use_fake_backends():
+        return fake_download(tickers, **kwargs)
+    import yfinance as yf
+    return yf.download(tickers, **kwargs)
+
+def get_yf_industry(industry_key):
+    """
+    yf.Industry, or its fake when fake backends are selected.
+    """
+    if use_fake_backends():
+        return FakeYFIndustry(industry_key)
+    import yfinance as yf
+    return yf.Industry(industry_key)
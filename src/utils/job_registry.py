@@ -0,0 +1,199 @@
+import time
+import heapq
+import itertools
+import threading
+import multiprocessing
+import concurrent.futures
+
+# Lower runs first: the ticker the user is looking at, stale context refreshes, then speculative prefetches
+FOREGROUND_PRIORITY = 0
+REFRESH_PRIORITY = 5
+PREFETCH_PRIORITY = 10
+# Seconds finished jobs are kept so reruns and other sessions can pick up their result
+FINISHED_JOB_TTL = 600
+
+class Job:
+    def __init__(self, key, fn, args, kwargs, priority):
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.state = 'queued'
+        self.future = concurrent.futures.Future()
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Progress events reported by the job, and the queue they arrive through from the worker process
+        self.progress = []
+        self.progress_queue = None
+        self.condition = threading.Condition()
+
+    def done(self):
+        return self.state in ('done', 'failed', 'cancelled')
+
+class JobRegistry:
+    def __init__(self, executor: concurrent.futures.Executor, max_in_flight: int):
+        """
+        Server-wide registry in front of an executor.
+        Jobs are keyed (e.g. by ticker): submitting a key that is queued, running or recently finished
+        returns the same future instead of starting a duplicate. Queued jobs are handed to the executor
+        by priority, at most max_in_flight at a time, so foreground work overtakes prefetches.
+
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor
+            Executor the jobs run on.
+        max_in_flight : int
+            Number of jobs handed to the executor at once, usually its number of workers.
+        """
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        self._jobs = {}
+        self._queue = []
+        self._counter = itertools.count()
+        self._running = 0
+        self._manager = None
+        self._lock = threading.RLock()
+
+    def submit(self, key, fn, *args, priority=FOREGROUND_PRIORITY, with_progress=False, **kwargs):
+        """
+        Queues fn(*args, **kwargs) under key and returns its future, or the future of the existing job with that key.
+        Resubmitting a queued job with a lower priority value moves it up the queue.
+        With with_progress, fn also gets a progress queue it can put event dicts on, readable with wait_for_progress.
+        """
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(key)
+            if job is not None and job.state in ('queued', 'running', 'done'):
+                if job.state == 'queued' and priority < job.priority:
+                    job.priority = priority
+                    heapq.heappush(self._queue, (priority, next(self._counter), key))
+                return job.future
+
+            job = Job(key, fn, args, kwargs, priority)
+            if with_progress:
+                job.progress_queue = self._get_manager().Queue()
+                job.kwargs = {**kwargs, 'progress': job.progress_queue}
+                threading.Thread(target=self._pump_progress, args=(job,), daemon=True).start()
+            self._jobs[key] = job
+            heapq.heappush(self._queue, (priority, next(self._counter), key))
+            self._dispatch()
+            return job.future
+
+    def _get_manager(self):
+        # Manager queues can be pickled to the worker processes, unlike plain queues
+        if self._manager is None:
+            self._manager = multiprocessing.Manager()
+        return self._manager
+
+    def _pump_progress(self, job):
+        while True:
+            event = job.progress_queue.get()
+            if event is None:
+                return
+            with job.condition:
+                job.progress.append(event)
+                job.condition.notify_all()
+
+    def _dispatch(self):
+        while self._running < self.max_in_flight and self._queue:
+            priority, _, key = heapq.heappop(self._queue)
+            job = self._jobs.get(key)
+            # Entries left behind by a priority change or a cancellation are skipped
+            if job is None or job.state != 'queued' or job.priority != priority:
+                continue
+            if not job.future.set_running_or_notify_cancel():
+                job.state = 'cancelled'
+                continue
+            job.state = 'running'
+            job.started_at = time.time()
+            self._running += 1
+            try:
+                inner = self.executor.submit(job.fn, *job.args, **job.kwargs)
+            except Exception as e:
+                self._finish(job, exception=e)
+                continue
+            inner.add_done_callback(lambda inner, job=job: self._on_done(job, inner))
+
+    def _on_done(self, job, inner):
+        exception = inner.exception()
+        with self._lock:
+            self._finish(job, result=None if exception else inner.result(), exception=exception)
+            self._dispatch()
+
+    def _finish(self, job, result=None, exception=None):
+        self._running -= 1
+        job.finished_at = time.time()
+        if exception is not None:
+            job.state = 'failed'
+            job.future.set_exception(exception)
+        else:
+            job.state = 'done'
+            job.future.set_result(result)
+        if job.progress_queue is not None:
+            job.progress_queue.put(None)
+        with job.condition:
+            job.condition.notify_all()
+
+    def _prune(self):
+        now = time.time()
+        for key in [key for key, job in self._jobs.items()
+                    if job.finished_at is not None and now - job.finished_at > FINISHED_JOB_TTL
+                    or job.state == 'cancelled']:
+            self._jobs.pop(key)
+
+    def get(self, key):
+        """
+        Returns the job registered under key, or None.
+        """
+        with self._lock:
+            return self._jobs.get(key)
+
+    def cancel(self, key):
+        """
+        Cancels a job that has not started yet, returns whether it was cancelled.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or job.state != 'queued':
+                return False
+            job.state = 'cancelled'
+            job.future.cancel()
+            if job.progress_queue is not None:
+                job.progress_queue.put(None)
+        with job.condition:
+            job.condition.notify_all()
+        return True
+
+    def wait_for_progress(self, key, seen=0, timeout=None):
+        """
+        Blocks until the job has progress events past the first seen ones or is finished.
+        Returns the new events and whether the job is finished.
+        """
+        job = self.get(key)
+        if job is None:
+            return [], True
+        with job.condition:
+            job.condition.wait_for(lambda: len(job.progress) > seen or job.done(), timeout=timeout)
+            return job.progress[seen:], job.done()
+
+    def queue_depth(self):
+        with self._lock:
+            return sum(job.state == 'queued' for job in self._jobs.values())
+
+    def idle_slots(self):
+        """
+        Number of jobs that could start right now without waiting.
+        """
+        with self._lock:
+            return max(self.max_in_flight - self._running - self.queue_depth(), 0)
+
+    def job_states(self):
+        with self._lock:
+            return {key: job.state for key, job in self._jobs.items()}
+
+    def stats(self):
+        with self._lock:
+            states = [job.state for job in self._jobs.values()]
+            return {state: states.count(state) for state in ('queued', 'running', 'done', 'failed')}
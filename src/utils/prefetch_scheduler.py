@@ -0,0 +1,79 @@
+import time
+import threading
+from utils.job_registry import JobRegistry, PREFETCH_PRIORITY
+
+# Maximum number of related tickers prefetched per ticker opened
+MAX_RELATED = 5
+# Maximum number of prefetches started per hour across the server
+PREFETCH_BUDGET_PER_HOUR = 30
+# Workers kept free for foreground builds
+RESERVED_SLOTS = 1
+
+class PrefetchScheduler:
+    def __init__(self,
+                 registry: JobRegistry,
+                 job_fn,
+                 max_related=MAX_RELATED,
+                 budget_per_hour=PREFETCH_BUDGET_PER_HOUR,
+                 reserved_slots=RESERVED_SLOTS):
+        """
+        Speculatively runs job_fn(ticker) for the tickers a user is likely to open next.
+        Prefetches are submitted under the ticker's own key at the lowest priority, so a user opening
+        a prefetched ticker joins the job already running. They only start when the registry has
+        idle capacity beyond reserved_slots and the hourly budget is not spent.
+
+        Parameters
+        ----------
+        registry : JobRegistry
+            Registry the prefetch jobs are submitted to.
+        job_fn : callable
+            Function warming the data of one ticker, picklable for the registry's executor.
+        max_related : int
+            Maximum number of related tickers prefetched per call to schedule.
+        budget_per_hour : int
+            Maximum number of prefetches started in any hour.
+        reserved_slots : int
+            Number of executor slots never used by prefetches.
+        """
+        self.registry = registry
+        self.job_fn = job_fn
+        self.max_related = max_related
+        self.budget_per_hour = budget_per_hour
+        self.reserved_slots = reserved_slots
+        self.started = []
+        self.pending = set()
+        self._lock = threading.Lock()
+
+    def remaining_budget(self):
+        now = time.time()
+        self.started = [started_at for started_at in self.started if now - started_at < 3600]
+        return self.budget_per_hour - len(self.started)
+
+    def schedule(self, tickers: list):
+        """
+        Submits prefetches for the first max_related tickers that are not already known to the registry,
+        as far as idle capacity and budget allow. Returns the tickers submitted.
+        Calling it again later tops up the prefetches once capacity frees up.
+        """
+        submitted = []
+        with self._lock:
+            for ticker in tickers[:self.max_related]:
+                if self.registry.get(ticker) is not None:
+                    continue
+                if self.registry.idle_slots() <= self.reserved_slots or self.remaining_budget() <= 0:
+                    break
+                self.registry.submit(ticker, self.job_fn, ticker, priority=PREFETCH_PRIORITY, with_progress=True)
+                self.started.append(time.time())
+                self.pending.add(ticker)
+                submitted.append(ticker)
+        return submitted
+
+    def cancel_pending(self, keep=None):
+        """
+        Cancels the prefetches that have not started yet, except keep, e.g. when foreground work arrives.
+        """
+        with self._lock:
+            for ticker in list(self.pending):
+                if ticker != keep:
+                    self.registry.cancel(ticker)
+            self.pending = set()
@@ -0,0 +1,253 @@
+"""
+Lightweight tracing of the slow steps of the app: searches, context builds, Bedrock calls, yfinance fetches
+and document processing. Spans record their duration, attributes such as payload sizes and cache hits,
+and their error if any. They are exported according to DATATHON_TRACING, a comma separated list of:
+
+- json, appends one JSON line per span to DATATHON_TRACE_LOG (defaults to the cache directory)
+- otel, mirrors the spans, nested the same way, on the configured OpenTelemetry tracer provider
+
+Tracing is off when DATATHON_TRACING is unset, spans then cost a couple of function calls.
+"""
+from utils.cache_utils import get_cache_dir
+import os
+import json
+import time
+import uuid
+import inspect
+import functools
+import threading
+import contextvars
+import contextlib
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+def payload_size(value):
+    """
+    Approximate size in bytes of a payload, e.g. a search answer, a request body or a DataFrame.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if hasattr(value, 'memory_usage'):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, 'sum') else usage)
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+class Span:
+    def __init__(self, name, parent=None, attributes: dict = None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start_time': self.start_time,
+            'duration': self.duration,
+            'error': self.error,
+            'attributes': self.attributes,
+            'pid': os.getpid(),
+        }
+
+class JsonLogExporter:
+    def __init__(self, path=None):
+        """
+        Appends spans as JSON lines to a local file, shared by every process of the server.
+        """
+        self.path = path or os.environ.get("DATATHON_TRACE_LOG") or os.path.join(get_cache_dir("traces"), "spans.jsonl")
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        # One write per span in append mode, so lines from several processes do not interleave
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line)
+
+class OpenTelemetryExporter:
+    def __init__(self):
+        """
+        Mirrors spans on the OpenTelemetry tracer, exported by whatever provider the server configured.
+        Each OpenTelemetry span is started with its parent's, so the nesting carries over to the backend.
+        """
+        from opentelemetry import trace
+        self.trace = trace
+        self.tracer = trace.get_tracer("datathon")
+
+    def start(self, span: Span):
+        parent = getattr(span.parent, '_otel_span', None)
+        context = self.trace.set_span_in_context(parent) if parent is not None else None
+        span._otel_span = self.tracer.start_span(span.name, context=context, start_time=int(span.start_time * 1e9))
+
+    def export(self, span: Span):
+        otel_span = getattr(span, '_otel_span', None)
+        if otel_span is None:
+            return
+        for key, value in span.attributes.items():
+            otel_span.set_attribute(key, value if isinstance(value, (str, bool, int, float)) else str(value))
+        if span.error is not None:
+            otel_span.set_attribute('error', span.error)
+        otel_span.end(end_time=int(span.start_time * 1e9) + int(span.duration * 1e9))
+
+EXPORTERS = {
+    'json': JsonLogExporter,
+    'otel': OpenTelemetryExporter,
+}
+
+class Tracer:
+    def __init__(self, exporters: list = None):
+        """
+        Creates spans and hands the finished ones to the exporters.
+        Also keeps per span name totals, e.g. to show where time goes without any exporter.
+        """
+        self.exporters = exporters or []
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def start_span(self, name, parent=None, **attributes):
+        """
+        Starts a span that is not made current, for code that cannot use the span context manager,
+        e.g. generators. It must be finished with end_span.
+        """
+        span = Span(name, parent if parent is not None else _current_span.get(), attributes)
+        for exporter in self.exporters:
+            if hasattr(exporter, 'start'):
+                try:
+                    exporter.start(span)
+                except Exception as e:
+                    print(f"Could not start span {span.name}: {str(e)}")
+        return span
+
+    def end_span(self, span: Span, error=None):
+        span.duration = time.perf_counter() - span._start
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        with self._lock:
+            total = self.totals.setdefault(span.name, {'count': 0, 'errors': 0, 'seconds': 0.0})
+            total['count'] += 1
+            total['errors'] += int(error is not None)
+            total['seconds'] += span.duration
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                print(f"Could not export span {span.name}: {str(e)}")
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """
+        Context manager timing the enclosed block as a child of the current span.
+        """
+        span = self.start_span(name, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, error=e)
+            raise
+        else:
+            self.end_span(span)
+        finally:
+            _current_span.reset(token)
+
+    def summary(self):
+        with self._lock:
+            return {name: dict(total) for name, total in self.totals.items()}
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+def get_tracer():
+    """
+    Process-wide tracer, with the exporters selected by DATATHON_TRACING.
+    """
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            exporters = []
+            for name in os.environ.get("DATATHON_TRACING", "").split(","):
+                name = name.strip().lower()
+                if not name:
+                    continue
+                try:
+                    exporters.append(EXPORTERS[name]())
+                except Exception as e:
+                    print(f"Could not set up the {name} trace exporter: {str(e)}")
+            _tracer = Tracer(exporters)
+        return _tracer
+
+def span(name, **attributes):
+    return get_tracer().span(name, **attributes)
+
+def current_span():
+    """
+    The span of the enclosing block, or None, so attributes can be added from deeper in the call.
+    """
+    return _current_span.get()
+
+def traced(name=None, record_result_size=True, **attributes):
+    """
+    Decorator running each call of a function in a span named after it.
+    Generator functions are timed until they are exhausted, with the time to their first item.
+    """
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                tracer = get_tracer()
+                span = tracer.start_span(span_name, **attributes)
+                size = 0
+                try:
+                    for item in fn(*args, **kwargs):
+                        if 'first_item_seconds' not in span.attributes:
+                            span.set('first_item_seconds', time.perf_counter() - span._start)
+                        size += payload_size(item)
+                        yield item
+                except GeneratorExit:
+                    # The consumer stopped early, e.g. a Streamlit rerun, which is not an error
+                    span.set('result_bytes', size)
+                    span.set('closed_early', True)
+                    tracer.end_span(span)
+                    raise
+                except BaseException as e:
+                    span.set('result_bytes', size)
+                    tracer.end_span(span, error=e)
+                    raise
+                span.set('result_bytes', size)
+                tracer.end_span(span)
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name, **attributes) as current:
+                result = fn(*args, **kwargs)
+                if record_result_size:
+                    current.set('result_bytes', payload_size(result))
+                return result
+        return wrapper
+    return decorator
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    """
+    Submits fn to an executor thread with the caller's current span, so its spans nest under it.
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)